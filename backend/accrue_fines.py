@@ -0,0 +1,58 @@
+import argparse
+import time
+
+from init_db import DB_PATH
+from library_db import LibraryDB
+
+# loans recalculated per transaction
+DEFAULT_CHUNK_SIZE = 5000
+
+# how long to wait (ms) for the GUI to release a write lock before giving up
+BUSY_TIMEOUT_MS = 30000
+
+#recalculate every loan's fine in committed chunks, e.g. from a nightly cron job
+def runAccrual(dbPath=DB_PATH, chunkSize=DEFAULT_CHUNK_SIZE, restart=False):
+    db = LibraryDB(dbPath)
+    db.conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+
+    start = time.perf_counter()
+    lastReport = start
+    loansDone = loansTotal = 0
+    firstDone = None
+
+    try:
+        for loansDone, loansTotal in db.iter_accrue_fines(chunkSize, restart):
+            if firstDone is None:
+                # the first report is where this run starts; a resumed run
+                # starts part way through
+                firstDone = loansDone
+                continue
+
+            now = time.perf_counter()
+            if now - lastReport >= 1 or loansDone == loansTotal:
+                rate = (loansDone - firstDone) / max(now - start, 1e-9)
+                print(f"{loansDone}/{loansTotal} loans ({rate:,.0f} rows/sec)")
+                lastReport = now
+    except KeyboardInterrupt:
+        print(f"Interrupted after {loansDone} loans; run again to resume.")
+        return False
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - start
+    processed = loansDone - (firstDone or 0)
+    print(f"Fine accrual finished: {processed} loans in {elapsed:.2f}s "
+          f"({processed / max(elapsed, 1e-9):,.0f} rows/sec).")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalculate fines for all loans in batches.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="loans per committed batch (default %(default)s)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore an interrupted run and start from the first loan")
+    args = parser.parse_args()
+    runAccrual(chunkSize=args.chunk_size, restart=args.restart)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from library_db import LibraryDB
+
+# Threads running searches and reports; each gets its own read-only connection
+READ_WORKERS = 4
+
+# Calls allowed in flight (running or queued) per lane before callers have
+# to wait for a slot
+MAX_PENDING_READS = 64
+MAX_PENDING_WRITES = 32
+
+# Seconds a call may take, waiting for a slot included
+DEFAULT_TIMEOUT = 10.0
+
+
+class _Lane:
+    """A bounded queue of LibraryDB calls and the threads that run them."""
+
+    def __init__(self, name, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.slots = asyncio.Semaphore(max_pending)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class _Call:
+    """
+    One LibraryDB call on a lane thread. stop() interrupts it only while
+    this call is running, never whatever its thread runs next, and keeps
+    its write from committing (see LibraryDB._guard_commits).
+    """
+
+    def __init__(self, db, work):
+        self.db = db
+        self.work = work
+        self.lock = threading.Lock()
+        self.thread_id = None
+        self.stopped = False
+
+    def run(self):
+        with self.lock:
+            if self.stopped:
+                return None
+            self.thread_id = threading.get_ident()
+        try:
+            with self.db._guard_commits(self):
+                return self.work(self.db)
+        finally:
+            with self.lock:
+                self.thread_id = None
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.thread_id is not None:
+                self.db.pool.interrupt(self.thread_id)
+
+
+class AsyncLibraryDB:
+    """
+    Coroutine versions of the LibraryDB operations, for use from asyncio
+    code such as an HTTP service.
+
+    Calls run on threads over one pooled LibraryDB. Reads (searches and
+    reports) and writes (checkouts, check-ins, fines) have separate lanes,
+    so a pile of slow reports can't hold up checkouts:
+      - the read lane has READ_WORKERS threads, each with a read-only
+        connection; the write lane has one thread on the writer connection
+        plus a reader of its own for the lookups check-in does first
+      - each lane admits a bounded number of calls; beyond that callers
+        wait for a slot (backpressure) instead of queueing without limit
+      - every call has a timeout covering the wait for a slot and the
+        call itself. On timeout (or when the awaiting task is cancelled) a
+        queued call is dropped and a running one has its statement
+        interrupted; a write that has not committed yet never will, so a
+        timed-out write only took effect if it committed before the
+        timeout. TimeoutError is raised
+
+    LibraryDB runs quiet: its messages (e.g. "Books successfully checked
+    in.") aren't printed, the return values carry the same outcome.
+    """
+
+    def __init__(self, db_path, read_workers=READ_WORKERS, timeout=DEFAULT_TIMEOUT,
+                 max_pending_reads=MAX_PENDING_READS, max_pending_writes=MAX_PENDING_WRITES):
+        self.timeout = timeout
+        self.db = LibraryDB(db_path, readers=read_workers + 1, quiet=True)
+        self.reads = _Lane("library-read", read_workers, max_pending_reads)
+        self.writes = _Lane("library-write", 1, max_pending_writes)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.reads.shutdown)
+        await loop.run_in_executor(None, self.writes.shutdown)
+        self.db.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # -------------------------------------------------
+    # Reads
+    # -------------------------------------------------
+    async def search_books(self, query, include_holder=False, limit=None, after_key=None, timeout=None):
+        return await self._call(
+            self.reads, timeout,
+            lambda db: db.search_books(query, include_holder, limit, after_key),
+        )
+
+    async def find_loans_for_checkin(self, query, timeout=None):
+        return await self._call(self.reads, timeout, lambda db: db.find_loans_for_checkin(query))
+
+    async def search_fines(self, query, include_paid=False, timeout=None):
+        return await self._call(self.reads, timeout, lambda db: db.search_fines(query, include_paid))
+
+    async def list_active_loans(self, timeout=None):
+        return await self._call(self.reads, timeout, lambda db: db.list_active_loans())
+
+    # -------------------------------------------------
+    # Writes
+    # -------------------------------------------------
+    async def checkout_book(self, isbn, card_id, timeout=None):
+        return await self._call(self.writes, timeout, lambda db: db.checkout_book(isbn, card_id))
+
+    async def checkout_books(self, card_ids_isbns, timeout=None):
+        return await self._call(self.writes, timeout, lambda db: db.checkout_books(card_ids_isbns))
+
+    async def checkin_book(self, query, selections, timeout=None):
+        return await self._call(self.writes, timeout, lambda db: db.checkin_book(query, selections))
+
+    async def checkin_loans(self, loan_ids, timeout=None):
+        return await self._call(self.writes, timeout, lambda db: db.checkin_loans(loan_ids))
+
+    async def update_fines(self, incremental=False, loan_ids=None, timeout=None):
+        return await self._call(
+            self.writes, timeout, lambda db: db.update_fines(incremental, loan_ids),
+        )
+
+    async def pay_fines(self, card_id, timeout=None):
+        return await self._call(self.writes, timeout, lambda db: db.pay_fines(card_id))
+
+    # -------------------------------------------------
+    # Dispatch
+    # -------------------------------------------------
+    async def _call(self, lane, timeout, work):
+        """
+        Run work(db) on lane within timeout seconds (self.timeout if None).
+        The lane slot is held until work actually finishes, so calls that
+        timed out still count against the lane until their thread is free.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+
+        try:
+            await asyncio.wait_for(lane.slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            # asyncio.TimeoutError is TimeoutError from Python 3.11 on
+            raise asyncio.TimeoutError("library database is busy; no slot freed up in time") from None
+
+        call = _Call(self.db, work)
+        try:
+            future = lane.executor.submit(call.run)
+        except BaseException:
+            lane.slots.release()
+            raise
+        future.add_done_callback(lambda _: self._release_slot(loop, lane))
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future, loop=loop),
+                max(deadline - time.monotonic(), 0),
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # A call still queued is dropped; a running one is interrupted
+            # so its connection is freed for the next call
+            if not future.cancel():
+                call.stop()
+            raise
+
+    @staticmethod
+    def _release_slot(loop, lane):
+        # Lane thread: the semaphore belongs to the event loop's thread
+        try:
+            loop.call_soon_threadsafe(lane.slots.release)
+        except RuntimeError:
+            # the loop has closed; nothing is left waiting for the slot
+            pass
@@ -0,0 +1,152 @@
+import argparse
+import csv
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import init_db
+
+# init_db functions timed as separate phases of initDb
+PHASES = [
+    "createTables",
+    "importCsv",
+    "importBorrowers",
+    "createIndexes",
+    "rebuildSearchIndex",
+    "rebuildBorrowerAccounts",
+    "checkForeignKeys",
+    "recordCsvHashes",
+]
+
+DEFAULT_SCALES = [10, 100, 1000]
+
+#write the bundled csv files scale times over, with keys made unique per copy
+def generateCatalog(scale, outDir, sourceDir=init_db.DATA_DIR):
+    outDir.mkdir(parents=True, exist_ok=True)
+    if (outDir/"done").exists():
+        return outDir
+
+    def copies(fileName, makeRow):
+        with (sourceDir/fileName).open("r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = [row for row in reader if row]
+        with (outDir/fileName).open("w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for copy in range(scale):
+                writer.writerows(makeRow(copy, row) for row in rows)
+        return len(rows)
+
+    # Author_id stays unique by shifting each copy past the highest original id
+    with (sourceDir/"authors.csv").open("r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        authorStep = max(int(row[0]) for row in reader if row)
+
+    def suffix(copy):
+        return "" if copy == 0 else f"-{copy}"
+
+    copies("book.csv", lambda copy, row: (row[0] + suffix(copy), row[1]))
+    copies("authors.csv", lambda copy, row: (int(row[0]) + copy * authorStep, row[1]))
+    copies("book_authors.csv",
+           lambda copy, row: (row[0] + suffix(copy), int(row[1]) + copy * authorStep))
+    borrowers = copies("borrower.csv", lambda copy, row: (
+        row[0] + suffix(copy),
+        f"{copy:03d}-{row[1]}" if copy else row[1],   # Ssn is UNIQUE
+        row[2], row[3], row[4],
+    ))
+
+    (outDir/"done").write_text(str(borrowers))
+    return outDir
+
+def peakRssMb():
+    # ru_maxrss is KiB on Linux; include parse workers
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+#run initDb on one catalog with every phase timed; returns the report dict
+def runOne(dataDir, dbPath):
+    dbPath.unlink(missing_ok=True)
+    phases = []
+
+    def timed(name, function):
+        def wrapper(conn, *args, **kwargs):
+            start = time.perf_counter()
+            result = function(conn, *args, **kwargs)
+            seconds = time.perf_counter() - start
+
+            phase = {"phase": name, "seconds": round(seconds, 3)}
+            if name == "importCsv":
+                tableName = args[0]
+                phase["phase"] = f"importCsv {tableName}"
+                phase["rows"] = conn.execute(f"SELECT COUNT(*) FROM {tableName};").fetchone()[0]
+            elif name == "importBorrowers":
+                phase["rows"] = conn.execute("SELECT COUNT(*) FROM BORROWER;").fetchone()[0]
+            if "rows" in phase:
+                phase["rows_per_sec"] = round(phase["rows"] / max(seconds, 1e-9))
+            phases.append(phase)
+            return result
+        return wrapper
+
+    for name in PHASES:
+        setattr(init_db, name, timed(name, getattr(init_db, name)))
+
+    start = time.perf_counter()
+    init_db.initDb(dbPath, dataDir)
+    total = time.perf_counter() - start
+
+    rows = sum(phase.get("rows", 0) for phase in phases)
+    return {
+        "data_dir": str(dataDir),
+        "total_seconds": round(total, 3),
+        "rows": rows,
+        "rows_per_sec": round(rows / max(total, 1e-9)),
+        "peak_rss_mb": peakRssMb(),
+        "db_size_mb": round(dbPath.stat().st_size / (1024 * 1024), 1),
+        "phases": phases,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time initDb on synthetic catalogs built from the bundled csv files.")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="comma separated copies of the bundled data (default %(default)s)")
+    parser.add_argument("--work-dir", type=Path, default=Path(tempfile.gettempdir())/"library_bench",
+                        help="where generated catalogs and databases go; catalogs are reused")
+    parser.add_argument("--output", type=Path, help="write the JSON report here as well as to stdout")
+    parser.add_argument("--run-one", nargs=2, metavar=("DATA_DIR", "DB_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        # child process, so peak RSS belongs to this catalog alone
+        print(json.dumps(runOne(Path(args.run_one[0]), Path(args.run_one[1]))))
+        return
+
+    reports = []
+    for scale in [int(s) for s in args.scales.split(",")]:
+        dataDir = generateCatalog(scale, args.work_dir/f"catalog_{scale}x")
+        dbPath = args.work_dir/f"library_{scale}x.db"
+        child = subprocess.run(
+            [sys.executable, __file__, "--run-one", str(dataDir), str(dbPath)],
+            capture_output=True, text=True, check=True,
+        )
+        report = json.loads(child.stdout.strip().splitlines()[-1])
+        report["scale"] = scale
+        reports.append(report)
+        print(f"{scale}x: {report['total_seconds']}s, {report['rows_per_sec']} rows/sec, "
+              f"peak RSS {report['peak_rss_mb']} MB, db {report['db_size_mb']} MB", file=sys.stderr)
+        dbPath.unlink(missing_ok=True)
+
+    result = json.dumps(reports, indent=2)
+    print(result)
+    if args.output:
+        args.output.write_text(result + "\n")
+
+if __name__ == "__main__":
+    main()
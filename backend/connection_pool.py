@@ -0,0 +1,162 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Prepared statements kept per connection; covers every statement and
+# template variant in statements.py with room to spare
+STATEMENT_CACHE_SIZE = 256
+
+# Connection settings applied to every pooled connection
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+# How long a statement waits on another connection's lock before SQLITE_BUSY
+BUSY_TIMEOUT_MS = 5000
+
+# Attempts at taking the write lock, and the first pause between them
+# (doubled after each busy attempt)
+WRITE_ATTEMPTS = 4
+WRITE_RETRY_DELAY = 0.05
+
+
+def connect(db_path, read_only=False):
+    """
+    Open db_path with the settings LibraryDB relies on. The read-write
+    connection also puts the file in WAL mode, which lets readers keep
+    reading the last committed data while a writer is busy.
+    """
+    if read_only:
+        uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(
+            uri, uri=True, check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+    else:
+        conn = sqlite3.connect(
+            db_path, check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA foreign_keys = ON;")
+        # with synchronous=NORMAL a WAL commit no longer waits on fsync
+        # (only checkpoints do)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+
+def is_busy(error):
+    # SQLITE_BUSY surfaces as OperationalError("database is locked")
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+class ConnectionPool:
+    """
+    One writer connection plus a fixed set of read-only connections to the
+    same WAL database, shared by any number of threads.
+
+    reader() lends out an idle read-only connection, waiting for one if all
+    are busy; with readers=0 reads share the writer. writer() gives one
+    thread at a time the writer connection. Readers never wait on the
+    writer: they see the last committed data until its commit lands.
+    """
+
+    def __init__(self, db_path, readers=0):
+        self.db_path = db_path
+
+        # Opened first, so the file is in WAL mode before any reader opens
+        self.writer_conn = connect(db_path)
+        # Reentrant, so a write method can call another one
+        self.write_lock = threading.RLock()
+
+        self.readers = [connect(db_path, read_only=True) for _ in range(readers)]
+        self.idle_readers = queue.Queue()
+        for conn in self.readers:
+            self.idle_readers.put(conn)
+
+        # thread ident -> connection it is using, for interrupt(). Changed
+        # and read under in_use_lock, so an interrupt can't land on a
+        # connection after it has been handed to another thread
+        self.in_use = {}
+        self.in_use_lock = threading.Lock()
+
+    @contextmanager
+    def reader(self):
+        if not self.readers:
+            with self.writer() as conn:
+                yield conn
+            return
+
+        conn = self.idle_readers.get()
+        thread_id = threading.get_ident()
+        # A read inside a write (e.g. check-in's lookups) lends this thread
+        # a reader; the writer is its connection again afterwards
+        with self.in_use_lock:
+            outer = self.in_use.get(thread_id)
+            self.in_use[thread_id] = conn
+        try:
+            yield conn
+        finally:
+            with self.in_use_lock:
+                if outer is None:
+                    del self.in_use[thread_id]
+                else:
+                    self.in_use[thread_id] = outer
+            self.idle_readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        with self.write_lock:
+            thread_id = threading.get_ident()
+            with self.in_use_lock:
+                outer = self.in_use.get(thread_id)
+                self.in_use[thread_id] = self.writer_conn
+            try:
+                yield self.writer_conn
+            finally:
+                with self.in_use_lock:
+                    if outer is None:
+                        del self.in_use[thread_id]
+                    else:
+                        self.in_use[thread_id] = outer
+
+    def begin_write(self):
+        """
+        BEGIN IMMEDIATE on the writer (the caller holds writer()), retrying
+        with backoff while another process holds the database's write lock
+        for longer than the busy timeout.
+        """
+        delay = WRITE_RETRY_DELAY
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                self.writer_conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as exc:
+                if not is_busy(exc) or attempt == WRITE_ATTEMPTS:
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    def interrupt(self, thread_id):
+        """
+        Abort the statement thread_id is running on its pooled connection,
+        if any. Callers must make sure thread_id is still doing the work
+        they mean to stop (see QueryExecutor.submit): the pool only knows
+        threads, not calls.
+        """
+        with self.in_use_lock:
+            conn = self.in_use.get(thread_id)
+            if conn is not None:
+                conn.interrupt()
+
+    def close(self):
+        for conn in self.readers:
+            conn.close()
+        self.writer_conn.close()
@@ -1,7 +1,14 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-from library_db import LibraryDB
 from init_db import DB_PATH
+from query_executor import QueryExecutor
+from virtual_tree import VirtualTreeview
+
+# Rows fetched per page in the Search tab
+SEARCH_PAGE_SIZE = 200
+
+# Pause in typing (ms) before the Search tab runs the query
+SEARCH_DEBOUNCE_MS = 250
 
 
 class LibraryGUI:
@@ -10,8 +17,14 @@ class LibraryGUI:
         self.root.title("Library Management System")
         self.root.geometry("1200x600")
 
-        # Database
-        self.db = LibraryDB(DB_PATH)
+        # Database work runs on background threads, results come back via root.after
+        self.executor = QueryExecutor(
+            self.root,
+            DB_PATH,
+            on_busy_changed=self.on_busy_changed,
+        )
+        # The executor's poll has to be cancelled while the root still exists
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Logged-in borrower
         self.current_user = None
@@ -28,6 +41,25 @@ class LibraryGUI:
 
         self.show_auth_screen()
 
+    def on_busy_changed(self, busy):
+        # Busy indicator while any database work is running
+        if busy:
+            self.root.config(cursor="watch")
+            self.busy_bar.start(10)
+        else:
+            self.root.config(cursor="")
+            self.busy_bar.stop()
+
+    def on_close(self):
+        self.executor.shutdown()
+        self.root.destroy()
+
+    def show_db_error(self, error):
+        messagebox.showerror(
+            "Database error",
+            f"The operation failed: {error}",
+        )
+
     def show_auth_screen(self):
         self.main_frame.pack_forget()
         self.auth_frame.pack(fill="both", expand=True, padx=20, pady=20)
@@ -206,17 +238,14 @@ class LibraryGUI:
             return
 
         # Authenticate the borrower
-        self.db.cur.execute(
-            """
-            SELECT Card_id, Bname
-            FROM BORROWER
-            WHERE Card_id = ? AND Password = ?
-            """,
-            (card_id, password),
+        self.executor.submit(
+            lambda db: db.authenticate_borrower(card_id, password),
+            on_done=self.finish_login,
+            on_error=self.show_db_error,
         )
-        row = self.db.cur.fetchone()
 
-        if row is None:
+    def finish_login(self, user):
+        if user is None:
             messagebox.showerror(
                 "Login failed",
                 "Invalid Card ID or password.",
@@ -225,7 +254,7 @@ class LibraryGUI:
 
         # Successful login
         self.is_admin = False
-        self.current_user = {"card_id": row[0], "name": row[1]}
+        self.current_user = user
         self.login_password_var.set("")  # clear password field
         self.show_main_screen()
         self.checkin_search_loans()
@@ -246,7 +275,13 @@ class LibraryGUI:
             return
 
         # Create the borrower
-        card_id = self.db.create_borrower(ssn, name, address, phone, password)
+        self.executor.submit(
+            lambda db: db.create_borrower(ssn, name, address, phone, password),
+            on_done=lambda card_id: self.finish_create_borrower(card_id, name),
+            on_error=self.show_db_error,
+        )
+
+    def finish_create_borrower(self, card_id, name):
         if not card_id:
             messagebox.showerror(
                 "Error",
@@ -313,6 +348,14 @@ class LibraryGUI:
             command=self.logout,
         ).pack(side="right")
 
+        # Runs while database work is in progress
+        self.busy_bar = ttk.Progressbar(
+            top_bar,
+            mode="indeterminate",
+            length=120,
+        )
+        self.busy_bar.pack(side="right", padx=10)
+
         # Separator
         ttk.Separator(self.main_frame, orient="horizontal").pack(
             fill="x",
@@ -364,19 +407,31 @@ class LibraryGUI:
             width=50,
         ).grid(row=0, column=1, sticky="w", pady=5, padx=5)
 
+        # Search as you type, once typing pauses
+        self.search_debounce_id = None
+        self.search_var.trace_add("write", self.on_search_typed)
+
         ttk.Button(
             search_frame,
             text="Search",
             command=self.perform_search,
         ).grid(row=0, column=2, sticky="w", pady=5, padx=5)
 
-        # Results table
+        # Results table (only the visible rows exist as Tk items)
         columns = ("isbn", "title", "authors", "status", "holder")
-        self.results_tree = ttk.Treeview(
+        self.results_tree = VirtualTreeview(
             search_frame,
             columns=columns,
-            show="headings",
             height=15,
+            row_values=lambda book: (
+                book["isbn"],
+                book["title"],
+                book["authors"],
+                book["status"],
+                book["holder"],  # Card_id of the current borrower, if OUT
+            ),
+            selectmode="extended",  # allow multi-select checkout
+            on_near_end=self.on_results_near_end,
         )
         self.results_tree.grid(
             row=1,
@@ -399,6 +454,12 @@ class LibraryGUI:
         self.results_tree.column("status", width=80, anchor="center")
         self.results_tree.column("holder", width=120, anchor="center")
 
+        # Keyset paging state for the current search
+        self.search_query = ""
+        self.search_last_isbn = None
+        self.search_exhausted = True
+        self.search_page_pending = False
+
         # Make treeview expandable
         search_frame.rowconfigure(1, weight=1)
         search_frame.columnconfigure(1, weight=1)
@@ -406,75 +467,87 @@ class LibraryGUI:
         # Checkout button
         ttk.Button(
             search_frame,
-            text="Checkout Selected Book",
+            text="Checkout Selected Books",
             command=self.checkout_selected_book,
         ).grid(row=2, column=0, columnspan=3, pady=10)
 
+    def on_search_typed(self, *_args):
+        if not self.current_user and not self.is_admin:
+            return
+        if self.search_debounce_id is not None:
+            self.root.after_cancel(self.search_debounce_id)
+        self.search_debounce_id = self.root.after(SEARCH_DEBOUNCE_MS, self.perform_search)
+
     def perform_search(self):
-        query = self.search_var.get().strip()
-        results = self.db.search_books(query)
-
-        # Clear old rows
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
-
-        # Insert new rows
-        for book in results:
-            holder = ""
-
-            # If the book is OUT, find which Card_id currently has it
-            if book["status"] == "OUT":
-                self.db.cur.execute(
-                    """
-                    SELECT Card_id
-                    FROM BOOK_LOANS
-                    WHERE Isbn = ? AND Date_in IS NULL
-                    ORDER BY Date_out DESC
-                    LIMIT 1
-                    """,
-                    (book["isbn"],),
-                )
-                row = self.db.cur.fetchone()
-                if row:
-                    holder = row[0]
-
-            self.results_tree.insert(
-                "",
-                "end",
-                values=(
-                    book["isbn"],
-                    book["title"],
-                    book["authors"],
-                    book["status"],
-                    holder,  # new column
-                ),
-            )
+        if self.search_debounce_id is not None:
+            self.root.after_cancel(self.search_debounce_id)
+            self.search_debounce_id = None
+
+        # No paging while the old rows are cleared
+        self.search_exhausted = True
+        self.results_tree.clear()
+
+        self.search_query = self.search_var.get().strip()
+        self.search_last_isbn = None
+        self.search_exhausted = False
+
+        # Only the first page is fetched now, the rest as the user scrolls
+        self.load_next_search_page()
+
+    def load_next_search_page(self):
+        if self.search_exhausted:
+            return
+
+        query = self.search_query
+        after_key = self.search_last_isbn
+        self.search_page_pending = True
+
+        # A newer search supersedes (and interrupts) this one
+        self.executor.submit(
+            lambda db: db.search_books(
+                query,
+                include_holder=True,
+                limit=SEARCH_PAGE_SIZE,
+                after_key=after_key,
+            ),
+            on_done=self.show_search_page,
+            on_error=self.show_search_error,
+            key="search",
+        )
+
+    def show_search_page(self, results):
+        self.search_page_pending = False
+        if len(results) < SEARCH_PAGE_SIZE:
+            self.search_exhausted = True
+        if results:
+            self.search_last_isbn = results[-1]["isbn"]
+
+        self.results_tree.append_rows(results)
+
+    def show_search_error(self, error):
+        # Let scrolling retry the page that failed
+        self.search_page_pending = False
+        self.show_db_error(error)
+
+    def on_results_near_end(self):
+        # Fetch another page once the view gets close to the loaded end
+        if not self.search_exhausted and not self.search_page_pending:
+            self.load_next_search_page()
 
 
     def checkout_selected_book(self):
-        selected = self.results_tree.selection()
+        selected = self.results_tree.selected_rows()
         if not selected:
             messagebox.showerror(
                 "No selection",
                 "Please select a book to checkout.",
             )
             return
-        if len(selected) > 1:
-            messagebox.showerror(
-                "Multiple selections",
-                "Please select only one book.",
-            )
-            return
-
-        item_id = selected[0]
-        values = self.results_tree.item(item_id, "values")
-        isbn = values[0]
-        status = values[3]  # IN / OUT
 
-        if status == "OUT":
+        if all(book["status"] == "OUT" for book in selected):
             messagebox.showerror(
                 "Unavailable",
-                "That book is already checked out.",
+                "The selected books are already checked out.",
             )
             return
 
@@ -483,7 +556,7 @@ class LibraryGUI:
             # Librarian: prompt for borrower card id
             card_id = simpledialog.askstring(
                 "Borrower Card ID",
-                "Enter the Borrower Card ID to checkout this book to:",
+                "Enter the Borrower Card ID to checkout the selected books to:",
                 parent=self.root,
             )
             if card_id is None:
@@ -506,18 +579,39 @@ class LibraryGUI:
                 return
             card_id = self.current_user["card_id"]
 
-        success = self.db.checkout_book(isbn, card_id)
-        if success:
+        # The whole cart goes through in one transaction, each book reported separately
+        isbns = [book["isbn"] for book in selected]
+        self.executor.submit(
+            lambda db: db.checkout_books([(card_id, isbn) for isbn in isbns]),
+            on_done=lambda results: self.finish_checkout(results, isbns, card_id),
+            on_error=self.show_db_error,
+        )
+
+    def finish_checkout(self, results, isbns, card_id):
+        checked_out = [isbn for isbn, result in zip(isbns, results) if result]
+        failed = [
+            f"{isbn}: {result.value}"
+            for isbn, result in zip(isbns, results)
+            if not result
+        ]
+
+        if not failed:
             messagebox.showinfo(
                 "Success",
-                f"Book {isbn} checked out successfully to {card_id}!",
+                f"Checked out {', '.join(checked_out)} to {card_id}!",
             )
-            self.perform_search()  # refresh status
-        else:
+        elif not checked_out:
             messagebox.showerror(
                 "Error",
-                "Checkout failed. Maximum loans reached or borrower has unpaid fines.",
+                "Checkout failed:\n" + "\n".join(failed),
+            )
+        else:
+            messagebox.showwarning(
+                "Partial checkout",
+                f"Checked out {', '.join(checked_out)} to {card_id}.\n\n"
+                "Not checked out:\n" + "\n".join(failed),
             )
+        self.perform_search()  # refresh status
 
 
     # Check In the book
@@ -547,12 +641,20 @@ class LibraryGUI:
             "date_out",
             "due_date",
         )
-        self.checkin_tree = ttk.Treeview(
+        self.checkin_tree = VirtualTreeview(
             frame,
             columns=columns,
-            show="headings",
             height=12,
             selectmode="extended",  # allow multi-select check-in
+            row_values=lambda loan: (
+                loan["isbn"],
+                loan["title"],
+                loan["authors"],
+                loan["borrower_name"],
+                loan["card_id"],
+                loan["date_out"],
+                loan["due_date"],
+            ),
         )
         self.checkin_tree.grid(
             row=1,
@@ -591,16 +693,10 @@ class LibraryGUI:
             command=self.checkin_selected_loans,
         ).grid(row=2, column=1, sticky="e", pady=5, padx=5)
 
-        # Store last search query so we can pass it to checkin_book
-        self.checkin_last_query = ""
-
-
         # Make listbox expandable
         frame.rowconfigure(2, weight=1)
         frame.columnconfigure(0, weight=1)
 
-        self.checkin_last_query = ""
-
 
     def checkin_search_loans(self):
         if not self.current_user:
@@ -612,44 +708,13 @@ class LibraryGUI:
 
         # Use the logged-in borrower's Card ID as the search query
         query = self.current_user["card_id"]
-        self.checkin_last_query = query
-
-        # Clear the tree
-        for item in self.checkin_tree.get_children():
-            self.checkin_tree.delete(item)
-
-        loans = self.db.find_loans_for_checkin(query)
-
-        for loan in loans:
-            isbn = loan["isbn"]
-
-            # 🔹 Inline query to get authors for this ISBN
-            self.db.cur.execute(
-                """
-                SELECT GROUP_CONCAT(A.Name, ', ')
-                FROM BOOK_AUTHORS BA
-                JOIN AUTHORS A ON BA.Author_id = A.Author_id
-                WHERE BA.Isbn = ?
-                """,
-                (isbn,),
-            )
-            row = self.db.cur.fetchone()
-            authors = row[0] if row and row[0] is not None else ""
-
-            # Insert row into the check-in tree
-            self.checkin_tree.insert(
-                "",
-                "end",
-                values=(
-                    isbn,
-                    loan["title"],
-                    authors,
-                    loan["borrower_name"],
-                    loan["card_id"],
-                    loan["date_out"],
-                    loan["due_date"],
-                ),
-            )
+
+        self.executor.submit(
+            lambda db: db.find_loans_for_checkin(query),
+            on_done=self.checkin_tree.set_rows,
+            on_error=self.show_db_error,
+            key="checkin",
+        )
 
 
     def checkin_selected_loans(self):
@@ -660,24 +725,24 @@ class LibraryGUI:
             )
             return
 
-        selected_items = self.checkin_tree.selection()
-        if not selected_items:
+        selected = self.checkin_tree.selected_rows()
+        if not selected:
             messagebox.showerror(
                 "Error",
                 "Please select at least one loan to check in.",
             )
             return
 
-        # Map selected tree rows to 1-based positions expected by checkin_book()
-        all_items = list(self.checkin_tree.get_children())
-        selections = []
-        for item_id in selected_items:
-            idx = all_items.index(item_id)  # 0-based
-            selections.append(idx + 1)      # convert to 1-based
+        # The rows already carry their loan ids, so nothing is searched again
+        loan_ids = [loan["loan_id"] for loan in selected]
 
-        query = self.checkin_last_query or self.current_user["card_id"]
+        self.executor.submit(
+            lambda db: db.checkin_loans(loan_ids),
+            on_done=self.finish_checkin,
+            on_error=self.show_db_error,
+        )
 
-        success = self.db.checkin_book(query, selections)
+    def finish_checkin(self, success):
         if success:
             messagebox.showinfo(
                 "Success",
@@ -735,10 +800,9 @@ class LibraryGUI:
         ).grid(row=1, column=2, sticky="w", pady=5, padx=5)
 
         columns = ("card_id", "name", "total_fine")
-        self.fines_tree = ttk.Treeview(
+        self.fines_tree = VirtualTreeview(
             frame,
             columns=columns,
-            show="headings",
             height=12,
         )
         self.fines_tree.grid(
@@ -763,54 +827,31 @@ class LibraryGUI:
 
 
     def handle_search_fines(self):
-        query = self.fines_search_var.get().strip().lower()
+        query = self.fines_search_var.get().strip()
         include_paid = self.include_paid_var.get()
 
-        where_parts = []
-        params = []
-
-        if query:
-            where_parts.append(
-                "(LOWER(B.Card_id) LIKE ? OR LOWER(B.Bname) LIKE ?)"
-            )
-            like = f"%{query}%"
-            params.extend([like, like])
-
-        if not include_paid:
-            # Only show unpaid fines by default
-            where_parts.append("F.Paid = 0")
-
-        where_sql = ""
-        if where_parts:
-            where_sql = "WHERE " + " AND ".join(where_parts)
-
-        sql = f"""
-            SELECT B.Card_id, B.Bname, SUM(F.Fine_amt)
-            FROM FINES F
-            JOIN BOOK_LOANS BL ON F.Loan_id = BL.Loan_id
-            JOIN BORROWER B    ON BL.Card_id = B.Card_id
-            {where_sql}
-            GROUP BY B.Card_id, B.Bname
-            ORDER BY B.Card_id;
-        """
-
-        self.db.cur.execute(sql, tuple(params))
-        rows = self.db.cur.fetchall()
-
-        # Clear tree
-        for item in self.fines_tree.get_children():
-            self.fines_tree.delete(item)
+        self.executor.submit(
+            lambda db: db.search_fines(query, include_paid),
+            on_done=self.show_fines,
+            on_error=self.show_db_error,
+            key="fines",
+        )
 
+    def show_fines(self, rows):
+        fines = []
         for card_id, name, total in rows:
             total_val = float(total) if total is not None else 0.0
-            self.fines_tree.insert(
-                "",
-                "end",
-                values=(card_id, name, f"{total_val:.2f}"),
-            )
+            fines.append((card_id, name, f"{total_val:.2f}"))
+        self.fines_tree.set_rows(fines)
 
     def handle_update_fines(self):
-        self.db.update_fines()
+        self.executor.submit(
+            lambda db: db.update_fines(incremental=True),
+            on_done=self.finish_update_fines,
+            on_error=self.show_db_error,
+        )
+
+    def finish_update_fines(self, _result):
         messagebox.showinfo(
             "Fines Updated",
             "Fines have been recalculated.",
@@ -820,7 +861,7 @@ class LibraryGUI:
             self.handle_search_fines()
 
     def handle_pay_selected_fines(self):
-        selected = self.fines_tree.selection()
+        selected = self.fines_tree.selected_rows()
         if not selected:
             messagebox.showerror(
                 "No selection",
@@ -828,11 +869,15 @@ class LibraryGUI:
             )
             return
 
-        item_id = selected[0]
-        values = self.fines_tree.item(item_id, "values")
-        card_id = values[0]
+        card_id = selected[0][0]
 
-        amount = self.db.pay_fines(card_id)
+        self.executor.submit(
+            lambda db: db.pay_fines(card_id),
+            on_done=lambda amount: self.finish_pay_fines(amount, card_id),
+            on_error=self.show_db_error,
+        )
+
+    def finish_pay_fines(self, amount, card_id):
         if amount is None or amount == 0.0:
             messagebox.showinfo(
                 "Error in fines",
@@ -860,10 +905,9 @@ class LibraryGUI:
         ).grid(row=0, column=1, sticky="w", pady=5, padx=5)
 
         columns = ("card_id", "name", "isbn", "title", "date_out", "due_date")
-        self.admin_loans_tree = ttk.Treeview(
+        self.admin_loans_tree = VirtualTreeview(
             frame,
             columns=columns,
-            show="headings",
             height=14,
         )
         self.admin_loans_tree.grid(
@@ -900,32 +944,12 @@ class LibraryGUI:
             )
             return
 
-        self.db.cur.execute(
-            """
-            SELECT BL.Card_id,
-                   BR.Bname,
-                   BL.Isbn,
-                   B.Title,
-                   BL.Date_out,
-                   BL.Due_date
-            FROM BOOK_LOANS BL
-            JOIN BORROWER BR ON BL.Card_id = BR.Card_id
-            JOIN BOOK     B  ON BL.Isbn    = B.Isbn
-            WHERE BL.Date_in IS NULL
-            ORDER BY BL.Card_id, BL.Isbn;
-            """
-        )
-        rows = self.db.cur.fetchall()
-
-        for item in self.admin_loans_tree.get_children():
-            self.admin_loans_tree.delete(item)
-
-        for card_id, name, isbn, title, date_out, due_date in rows:
-            self.admin_loans_tree.insert(
-                "",
-                "end",
-                values=(card_id, name, isbn, title, date_out, due_date),
-            )
+        self.executor.submit(
+            lambda db: db.list_active_loans(),
+            on_done=self.admin_loans_tree.set_rows,
+            on_error=self.show_db_error,
+            key="admin_loans",
+        )
 
     def on_tab_changed(self, event):
         if not self.current_user:
@@ -960,7 +984,7 @@ class LibraryGUI:
 
 def main():
     root = tk.Tk()
-    app = LibraryGUI(root)
+    LibraryGUI(root)
     root.mainloop()
 
 
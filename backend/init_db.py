@@ -1,18 +1,43 @@
+import argparse
+import io
+import os
 import sqlite3
 import csv
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from pathlib import Path
 
+from migrations import migrate
+
 DB_PATH = Path(__file__).parent / "library.db"
 DATA_DIR = Path(__file__).parent / "data"
 
+# page cache (KiB) used while bulk loading a new database
+BULK_CACHE_KB = 256 * 1024
+
+# processes parsing csv files during import; files below PARALLEL_MIN_BYTES are parsed in-process
+PARSE_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+# bytes of csv handed to a worker at a time
+PARSE_PIECE_BYTES = 4 * 1024 * 1024
+
+# catalog files kept in step by syncCatalog: table, file, columns, key columns
+CATALOG_FILES = [
+    ("BOOK", "book.csv", ["Isbn", "Title"], ["Isbn"]),
+    ("AUTHORS", "authors.csv", ["Author_id", "Name"], ["Author_id"]),
+    ("BOOK_AUTHORS", "book_authors.csv", ["Isbn", "Author_id"], ["Isbn", "Author_id"]),
+]
+
 #open database, run sql
-def getConnection():
-    conn = sqlite3.connect(DB_PATH)
+def getConnection(dbPath=DB_PATH):
+    conn = sqlite3.connect(dbPath)
     conn.execute("PRAGMA foreign_keys = ON;")
     return conn
 
-#creates tables
-def createTables(conn):
+#creates tables; deferIndexes leaves out indexes, search tables and triggers (see createIndexes)
+def createTables(conn, deferIndexes=False):
     cur = conn.cursor()
 
     cur.execute("""
@@ -60,7 +85,279 @@ def createTables(conn):
             FOREIGN KEY (Loan_id) REFERENCES BOOK_LOANS(Loan_id)
             );"""
     )
+
+    # bookkeeping values, e.g. when fines were last accrued
+    cur.execute(
+            """CREATE TABLE IF NOT EXISTS LIBRARY_META(
+            Key TEXT PRIMARY KEY,
+            Value TEXT NOT NULL
+            );"""
+    )
+
+    if not deferIndexes:
+        createIndexes(conn)
+    conn.commit()
+
+
+#secondary indexes, search index and account summary; cheaper to build after a bulk load.
+#what is created here is the schema every database had before PRAGMA user_version
+#was used (version 0), so it stays idempotent; later changes are migrations
+def createIndexes(conn):
+    cur = conn.cursor()
+
+    # at most one active loan per book, so concurrent checkouts can't both
+    # succeed; also how IN/OUT status and checkout find a book's active loan.
+    # Without it double checkouts go unchecked, so existing duplicates stop
+    # the init until they are checked in
+    try:
+        cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS IDX_BOOK_LOANS_ONE_ACTIVE
+                    ON BOOK_LOANS(Isbn) WHERE Date_in IS NULL;""")
+    except sqlite3.IntegrityError:
+        cur.execute("""
+                    SELECT Isbn, GROUP_CONCAT(Loan_id, ', ')
+                    FROM BOOK_LOANS
+                    WHERE Date_in IS NULL
+                    GROUP BY Isbn
+                    HAVING COUNT(*) > 1;""")
+        duplicates = "; ".join(f"{isbn}: loans {loans}" for isbn, loans in cur.fetchall())
+        raise sqlite3.IntegrityError(
+            "some books have more than one active loan; check in all but one "
+            f"of each and run init_db.py again ({duplicates})"
+        ) from None
+
+    # returned loans by return date, for incremental fine accrual
+    cur.execute("""
+                CREATE INDEX IF NOT EXISTS IDX_BOOK_LOANS_DATE_IN
+                ON BOOK_LOANS(Date_in) WHERE Date_in IS NOT NULL;""")
+
+    createSearchIndex(conn)
+    createBorrowerAccounts(conn)
+
+    # indexes added since the schema above was first shipped
+    migrate(conn)
+
+
+#trigram index over ISBNs, titles, author names and borrowers, kept in sync by triggers
+def createSearchIndex(conn):
+    cur = conn.cursor()
+
+    # earlier versions indexed whole words, which can't answer substring
+    # queries; drop those so they get rebuilt with the trigram tokenizer
+    cur.execute("SELECT sql FROM sqlite_master WHERE name = 'BOOK_FTS';")
+    row = cur.fetchone()
+    if row is not None and "trigram" not in row[0]:
+        cur.execute("DROP TABLE BOOK_FTS;")
+        cur.execute("DROP TABLE IF EXISTS AUTHOR_FTS;")
+
+    # BOOK_FTS rowid mirrors BOOK.rowid, AUTHOR_FTS rowid mirrors Author_id,
+    # BORROWER_FTS rowid mirrors BORROWER.rowid
+    cur.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS BOOK_FTS
+                USING fts5(Isbn, Title, tokenize = 'trigram');""")
+    cur.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS AUTHOR_FTS
+                USING fts5(Name, tokenize = 'trigram');""")
+    cur.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS BORROWER_FTS
+                USING fts5(Card_id, Bname, tokenize = 'trigram');""")
+
+    # author -> books lookup used when a search matches an author name
+    cur.execute("""
+                CREATE INDEX IF NOT EXISTS IDX_BOOK_AUTHORS_AUTHOR_ID
+                ON BOOK_AUTHORS(Author_id);""")
+
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BOOK_FTS_INSERT AFTER INSERT ON BOOK
+                BEGIN
+                    INSERT INTO BOOK_FTS (rowid, Isbn, Title)
+                    VALUES (NEW.rowid, NEW.Isbn, NEW.Title);
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BOOK_FTS_DELETE AFTER DELETE ON BOOK
+                BEGIN
+                    DELETE FROM BOOK_FTS WHERE rowid = OLD.rowid;
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BOOK_FTS_UPDATE AFTER UPDATE ON BOOK
+                BEGIN
+                    DELETE FROM BOOK_FTS WHERE rowid = OLD.rowid;
+                    INSERT INTO BOOK_FTS (rowid, Isbn, Title)
+                    VALUES (NEW.rowid, NEW.Isbn, NEW.Title);
+                END;""")
+
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS AUTHOR_FTS_INSERT AFTER INSERT ON AUTHORS
+                BEGIN
+                    INSERT INTO AUTHOR_FTS (rowid, Name)
+                    VALUES (NEW.Author_id, NEW.Name);
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS AUTHOR_FTS_DELETE AFTER DELETE ON AUTHORS
+                BEGIN
+                    DELETE FROM AUTHOR_FTS WHERE rowid = OLD.Author_id;
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS AUTHOR_FTS_UPDATE AFTER UPDATE ON AUTHORS
+                BEGIN
+                    DELETE FROM AUTHOR_FTS WHERE rowid = OLD.Author_id;
+                    INSERT INTO AUTHOR_FTS (rowid, Name)
+                    VALUES (NEW.Author_id, NEW.Name);
+                END;""")
+
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BORROWER_FTS_INSERT AFTER INSERT ON BORROWER
+                BEGIN
+                    INSERT INTO BORROWER_FTS (rowid, Card_id, Bname)
+                    VALUES (NEW.rowid, NEW.Card_id, NEW.Bname);
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BORROWER_FTS_DELETE AFTER DELETE ON BORROWER
+                BEGIN
+                    DELETE FROM BORROWER_FTS WHERE rowid = OLD.rowid;
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BORROWER_FTS_UPDATE AFTER UPDATE ON BORROWER
+                BEGIN
+                    DELETE FROM BORROWER_FTS WHERE rowid = OLD.rowid;
+                    INSERT INTO BORROWER_FTS (rowid, Card_id, Bname)
+                    VALUES (NEW.rowid, NEW.Card_id, NEW.Bname);
+                END;""")
+
+
+#refill the search index from the base tables (new databases and ones created before it existed)
+def rebuildSearchIndex(conn):
+    cur = conn.cursor()
+    fills = [
+        ("BOOK_FTS", "INSERT INTO BOOK_FTS (rowid, Isbn, Title) SELECT rowid, Isbn, Title FROM BOOK;"),
+        ("AUTHOR_FTS", "INSERT INTO AUTHOR_FTS (rowid, Name) SELECT Author_id, Name FROM AUTHORS;"),
+        ("BORROWER_FTS", "INSERT INTO BORROWER_FTS (rowid, Card_id, Bname) SELECT rowid, Card_id, Bname FROM BORROWER;"),
+    ]
+    for table, fill in fills:
+        cur.execute(f"DELETE FROM {table};")
+        # merging segments once at the end beats merging while filling
+        cur.execute(f"INSERT INTO {table} ({table}, rank) VALUES ('automerge', 0);")
+        cur.execute(fill)
+        cur.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize');")
+        cur.execute(f"INSERT INTO {table} ({table}, rank) VALUES ('automerge', 4);")
+    conn.commit()
+
+
+#per-borrower totals used for checkout eligibility, kept up to date by triggers
+def createBorrowerAccounts(conn):
+    cur = conn.cursor()
+
+    cur.execute(
+            """CREATE TABLE IF NOT EXISTS BORROWER_ACCOUNT(
+            Card_id TEXT PRIMARY KEY,
+            Active_loan_count INTEGER NOT NULL DEFAULT 0,
+            Unpaid_fine_total REAL NOT NULL DEFAULT 0,
+            FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
+            );"""
+    )
+
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BORROWER_ACCOUNT_INSERT AFTER INSERT ON BORROWER
+                BEGIN
+                    INSERT OR IGNORE INTO BORROWER_ACCOUNT (Card_id) VALUES (NEW.Card_id);
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS BORROWER_ACCOUNT_DELETE BEFORE DELETE ON BORROWER
+                BEGIN
+                    DELETE FROM BORROWER_ACCOUNT WHERE Card_id = OLD.Card_id;
+                END;""")
+
+    # active loans: a loan counts while Date_in IS NULL
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS LOAN_ACCOUNT_INSERT AFTER INSERT ON BOOK_LOANS
+                WHEN NEW.Date_in IS NULL
+                BEGIN
+                    UPDATE BORROWER_ACCOUNT SET Active_loan_count = Active_loan_count + 1
+                    WHERE Card_id = NEW.Card_id;
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS LOAN_ACCOUNT_DELETE AFTER DELETE ON BOOK_LOANS
+                WHEN OLD.Date_in IS NULL
+                BEGIN
+                    UPDATE BORROWER_ACCOUNT SET Active_loan_count = Active_loan_count - 1
+                    WHERE Card_id = OLD.Card_id;
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS LOAN_ACCOUNT_UPDATE AFTER UPDATE OF Date_in, Card_id ON BOOK_LOANS
+                BEGIN
+                    UPDATE BORROWER_ACCOUNT SET
+                        Active_loan_count = Active_loan_count - (OLD.Date_in IS NULL),
+                        Unpaid_fine_total = ROUND(Unpaid_fine_total - COALESCE((
+                            SELECT Fine_amt FROM FINES
+                            WHERE Loan_id = OLD.Loan_id AND Paid = 0
+                              AND OLD.Card_id <> NEW.Card_id), 0), 2)
+                    WHERE Card_id = OLD.Card_id;
+                    UPDATE BORROWER_ACCOUNT SET
+                        Active_loan_count = Active_loan_count + (NEW.Date_in IS NULL),
+                        Unpaid_fine_total = ROUND(Unpaid_fine_total + COALESCE((
+                            SELECT Fine_amt FROM FINES
+                            WHERE Loan_id = NEW.Loan_id AND Paid = 0
+                              AND OLD.Card_id <> NEW.Card_id), 0), 2)
+                    WHERE Card_id = NEW.Card_id;
+                END;""")
+
+    # unpaid fines, charged to the borrower holding the loan
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS FINE_ACCOUNT_INSERT AFTER INSERT ON FINES
+                WHEN NEW.Paid = 0
+                BEGIN
+                    UPDATE BORROWER_ACCOUNT SET Unpaid_fine_total = ROUND(Unpaid_fine_total + NEW.Fine_amt, 2)
+                    WHERE Card_id = (SELECT Card_id FROM BOOK_LOANS WHERE Loan_id = NEW.Loan_id);
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS FINE_ACCOUNT_DELETE AFTER DELETE ON FINES
+                WHEN OLD.Paid = 0
+                BEGIN
+                    UPDATE BORROWER_ACCOUNT SET Unpaid_fine_total = ROUND(Unpaid_fine_total - OLD.Fine_amt, 2)
+                    WHERE Card_id = (SELECT Card_id FROM BOOK_LOANS WHERE Loan_id = OLD.Loan_id);
+                END;""")
+    cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS FINE_ACCOUNT_UPDATE AFTER UPDATE ON FINES
+                BEGIN
+                    UPDATE BORROWER_ACCOUNT SET Unpaid_fine_total = ROUND(
+                        Unpaid_fine_total - CASE WHEN OLD.Paid = 0 THEN OLD.Fine_amt ELSE 0 END, 2)
+                    WHERE Card_id = (SELECT Card_id FROM BOOK_LOANS WHERE Loan_id = OLD.Loan_id);
+                    UPDATE BORROWER_ACCOUNT SET Unpaid_fine_total = ROUND(
+                        Unpaid_fine_total + CASE WHEN NEW.Paid = 0 THEN NEW.Fine_amt ELSE 0 END, 2)
+                    WHERE Card_id = (SELECT Card_id FROM BOOK_LOANS WHERE Loan_id = NEW.Loan_id);
+                END;""")
+
+
+#recompute BORROWER_ACCOUNT from the base tables, returns how many rows were wrong
+def rebuildBorrowerAccounts(conn):
+    cur = conn.cursor()
+    cur.execute("""
+                INSERT INTO BORROWER_ACCOUNT (Card_id, Active_loan_count, Unpaid_fine_total)
+                SELECT
+                    B.Card_id,
+                    (
+                        SELECT COUNT(*)
+                        FROM BOOK_LOANS
+                        WHERE Card_id = B.Card_id AND Date_in IS NULL
+                    ),
+                    (
+                        SELECT ROUND(COALESCE(SUM(F.Fine_amt), 0), 2)
+                        FROM BOOK_LOANS BL
+                        JOIN FINES F ON F.Loan_id = BL.Loan_id
+                        WHERE BL.Card_id = B.Card_id AND F.Paid = 0
+                    )
+                FROM BORROWER B
+                WHERE true
+                ON CONFLICT(Card_id) DO UPDATE SET
+                    Active_loan_count = excluded.Active_loan_count,
+                    Unpaid_fine_total = excluded.Unpaid_fine_total
+                WHERE Active_loan_count <> excluded.Active_loan_count
+                   OR Unpaid_fine_total <> excluded.Unpaid_fine_total;""")
+    fixed = cur.rowcount
+    cur.execute("DELETE FROM BORROWER_ACCOUNT WHERE Card_id NOT IN (SELECT Card_id FROM BORROWER);")
+    fixed += cur.rowcount
     conn.commit()
+    return fixed
 
 
 def isTableEmpty(conn, tableName):
@@ -69,68 +366,352 @@ def isTableEmpty(conn, tableName):
     count = cur.fetchone()[0]
     return count == 0
 
-def importCsv(conn, tableName, csvPath, columns):
-    with csvPath.open("r", encoding ="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = [
-            [row[col] for col in columns]
-            for row in reader
-        ]
+def isNewDatabase(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table';")
+    return cur.fetchone()[0] == 0
 
+#stream a csv file as tuples in the given column order, one row in memory at a time
+def readCsv(csvPath, columns, normalize=None):
+    with csvPath.open("r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        pick = itemgetter(*[header.index(col) for col in columns])
+        for row in reader:
+            if row:
+                yield normalize(pick(row)) if normalize else pick(row)
+
+#byte ranges covering a csv file after its header, each starting at a line boundary
+def splitCsv(csvPath, pieceBytes=PARSE_PIECE_BYTES):
+    size = csvPath.stat().st_size
+    ranges = []
+    with csvPath.open("rb") as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + pieceBytes, size))
+            f.readline()   # run on to the end of the line we landed in
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+#worker process: parse one byte range of a csv file into tuples
+def parseCsvPiece(csvPath, start, end, positions, normalize=None):
+    with csvPath.open("rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    pick = itemgetter(*positions)
+    rows = [pick(row) for row in csv.reader(io.StringIO(text, newline="")) if row]
+    if normalize:
+        rows = [normalize(row) for row in rows]
+    return rows
+
+#like readCsv, but pieces of the file are parsed by worker processes while the caller writes;
+#records must not contain line breaks inside quoted fields (true of the catalog files)
+def readCsvParallel(csvPath, columns, normalize=None, workers=PARSE_WORKERS):
+    with csvPath.open("r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f))
+    positions = [header.index(col) for col in columns]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # keep a few pieces in flight so memory stays flat when the writer is slower
+        pending = deque()
+        for start, end in splitCsv(csvPath):
+            pending.append(pool.submit(parseCsvPiece, csvPath, start, end, positions, normalize))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+#rows of a csv file, parsed in parallel when the file is big enough to be worth it
+def readCsvRows(csvPath, columns, normalize=None, workers=PARSE_WORKERS):
+    if workers > 1 and csvPath.stat().st_size >= PARALLEL_MIN_BYTES:
+        return readCsvParallel(csvPath, columns, normalize, workers)
+    return readCsv(csvPath, columns, normalize)
+
+#the connection stays on the calling thread, which does all the writing
+def importCsv(conn, tableName, csvPath, columns, workers=PARSE_WORKERS):
     placeholders = ",".join(["?"] * len(columns))
     col_list = ",".join(columns)
 
     sql = f"INSERT INTO {tableName} ({col_list}) VALUES ({placeholders})"
-    conn.executemany(sql, rows)
-    
+    conn.executemany(sql, readCsvRows(csvPath, columns, workers=workers))
+
     conn.commit()
 
-def importBorrowers(conn, csvPath):
-    with csvPath.open("r", encoding ="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = []
-        for row in reader:
-            ssn = row["Ssn"].strip()
-            if len(ssn) >= 4:
-                password = ssn[-4:]       # last 4 digits of SSN
-            else:
-                password = "password"     # fallback
-
-            rows.append([
-                row["Card_id"],
-                row["Ssn"],
-                row["Bname"],
-                row["Address"],
-                row["Phone"],
-                password
-            ])
+BORROWER_CSV_COLUMNS = ["Card_id", "Ssn", "Bname", "Address", "Phone"]
 
+#add the initial password (last 4 digits of the SSN) to a borrower csv row
+def borrowerRow(row):
+    card_id, ssn, name, address, phone = row
+    ssn_digits = ssn.strip()
+    if len(ssn_digits) >= 4:
+        password = ssn_digits[-4:]   # last 4 digits of SSN
+    else:
+        password = "password"        # fallback
+    return card_id, ssn, name, address, phone, password
+
+def importBorrowers(conn, csvPath, workers=PARSE_WORKERS):
     conn.executemany(
         "INSERT INTO BORROWER (Card_id, Ssn, Bname, Address, Phone, Password) "
         "VALUES (?, ?, ?, ?, ?, ?)",
-        rows
+        readCsvRows(csvPath, BORROWER_CSV_COLUMNS, borrowerRow, workers)
     )
     conn.commit()
 
-def importData(conn):
+#load each table from its csv file if the table is still empty
+def importTables(conn, dataDir=DATA_DIR):
     if isTableEmpty(conn, "BOOK"):
-        importCsv(conn, "BOOK", DATA_DIR/"book.csv", ["Isbn", "Title"])
+        importCsv(conn, "BOOK", dataDir/"book.csv", ["Isbn", "Title"])
     
     if isTableEmpty(conn, "AUTHORS"):
-        importCsv(conn, "AUTHORS", DATA_DIR/"authors.csv", ["Author_id", "Name"])
+        importCsv(conn, "AUTHORS", dataDir/"authors.csv", ["Author_id", "Name"])
     
     if isTableEmpty(conn, "BOOK_AUTHORS"):
-        importCsv(conn, "BOOK_AUTHORS", DATA_DIR/"book_authors.csv", ["Isbn", "Author_id"])
+        importCsv(conn, "BOOK_AUTHORS", dataDir/"book_authors.csv", ["Isbn", "Author_id"])
 
     if isTableEmpty(conn, "BORROWER"):
-        importBorrowers(conn, DATA_DIR/"borrower.csv")
-        
-def initDb():
+        importBorrowers(conn, dataDir/"borrower.csv")
+
+#fill the search index and account summary for rows loaded without their triggers
+def rebuildDerivedTables(conn):
+    # rows loaded before the search index existed
+    if isTableEmpty(conn, "BOOK_FTS") and not isTableEmpty(conn, "BOOK"):
+        rebuildSearchIndex(conn)
+
+    # borrowers loaded before the account table existed
+    if isTableEmpty(conn, "BORROWER_ACCOUNT") and not isTableEmpty(conn, "BORROWER"):
+        rebuildBorrowerAccounts(conn)
+
+def importData(conn, dataDir=DATA_DIR):
+    importTables(conn, dataDir)
+    rebuildDerivedTables(conn)
+
+#fast, non crash-safe settings for filling a brand new database file
+def beginBulkLoad(conn):
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys = OFF;")
+    conn.execute("PRAGMA journal_mode = OFF;")
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute(f"PRAGMA cache_size = -{BULK_CACHE_KB};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+
+def endBulkLoad(conn):
+    conn.commit()
+    # the journal mode LibraryDB opens the file with
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = FULL;")
+    conn.execute("PRAGMA foreign_keys = ON;")
+
+#report rows whose foreign keys point at missing rows (not enforced during a bulk load)
+def checkForeignKeys(conn):
+    cur = conn.cursor()
+    cur.execute("PRAGMA foreign_key_check;")
+    counts = {}
+    for table, _rowid, parent, _fkid in cur:
+        counts[(table, parent)] = counts.get((table, parent), 0) + 1
+    for (table, parent), count in sorted(counts.items()):
+        print(f"WARNING: {count} rows in {table} reference missing {parent} rows.")
+    return sum(counts.values())
+
+#build a new database: load tables first, then indexes, search index and triggers
+def bulkImport(conn, dataDir=DATA_DIR):
+    createTables(conn, deferIndexes=True)
+    beginBulkLoad(conn)
+    try:
+        importTables(conn, dataDir)
+        createIndexes(conn)
+        rebuildDerivedTables(conn)
+        checkForeignKeys(conn)
+    finally:
+        endBulkLoad(conn)
+
+#build a new database in a scratch file next to dbPath and move it into place
+#once complete: the bulk load runs without a journal, so an interrupted load
+#must never be left where initDb would take it for a finished database
+def buildDatabase(dbPath=DB_PATH, dataDir=DATA_DIR):
+    dbPath = Path(dbPath)
+    buildPath = dbPath.with_name(dbPath.name + ".building")
+    removeDatabaseFiles(buildPath)
+
+    conn = getConnection(buildPath)
+    try:
+        bulkImport(conn, dataDir)
+        recordCsvHashes(conn, dataDir)
+        conn.close()
+        removeDatabaseFiles(dbPath)
+        os.replace(buildPath, dbPath)
+    except BaseException:
+        conn.close()
+        removeDatabaseFiles(buildPath)
+        raise
+
+#delete a database file with its WAL and shared-memory files
+def removeDatabaseFiles(dbPath):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        Path(f"{dbPath}{suffix}").unlink(missing_ok=True)
+
+def getMeta(conn, key):
+    cur = conn.cursor()
+    cur.execute("SELECT Value FROM LIBRARY_META WHERE Key = ?;", (key,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def setMeta(conn, key, value):
+    conn.execute(
+        "INSERT INTO LIBRARY_META (Key, Value) VALUES (?, ?) "
+        "ON CONFLICT(Key) DO UPDATE SET Value = excluded.Value;",
+        (key, str(value))
+    )
+
+def fileHash(path):
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+#remember the catalog files just loaded so the next sync can skip them
+def recordCsvHashes(conn, dataDir=DATA_DIR):
+    for _table, fileName, _columns, _keys in CATALOG_FILES:
+        setMeta(conn, f"csv_sha256:{fileName}", fileHash(dataDir/fileName))
+    conn.commit()
+
+#load a csv file into an empty TEMP copy of tableName, one row per key (last one wins)
+def stageCsv(conn, tableName, csvPath, columns, keys):
+    stage = f"SYNC_{tableName}"
+    col_list = ",".join(columns)
+    conn.execute(f"DROP TABLE IF EXISTS temp.{stage};")
+    conn.execute(f"CREATE TEMP TABLE {stage} AS SELECT {col_list} FROM {tableName} WHERE 0;")
+    conn.execute(f"CREATE UNIQUE INDEX temp.{stage}_KEY ON {stage} ({','.join(keys)});")
+
+    placeholders = ",".join(["?"] * len(columns))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO temp.{stage} ({col_list}) VALUES ({placeholders})",
+        readCsvRows(csvPath, columns)
+    )
+    return stage
+
+#insert new rows and update changed ones; returns how many rows were written
+def upsertFromStage(conn, tableName, stage, columns, keys):
+    col_list = ",".join(columns)
+    values = [col for col in columns if col not in keys]
+    if values:
+        changed = " OR ".join(f"{col} IS NOT excluded.{col}" for col in values)
+        conflict = (
+            f"ON CONFLICT({','.join(keys)}) DO UPDATE SET "
+            + ", ".join(f"{col} = excluded.{col}" for col in values)
+            + f" WHERE {changed}"
+        )
+    else:
+        conflict = "ON CONFLICT DO NOTHING"
+    cur = conn.cursor()
+    cur.execute(f"""
+                INSERT INTO {tableName} ({col_list})
+                SELECT {col_list} FROM temp.{stage} WHERE true
+                {conflict};""")
+    return cur.rowcount
+
+#bring the catalog tables in line with the csv files, skipping files that haven't changed
+def syncCatalog(conn, dataDir=DATA_DIR):
+    cur = conn.cursor()
+    changedFiles = {}
+    droppedLinks = 0
+    try:
+        for tableName, fileName, columns, keys in CATALOG_FILES:
+            csvHash = fileHash(dataDir/fileName)
+            if getMeta(conn, f"csv_sha256:{fileName}") == csvHash:
+                print(f"{fileName}: unchanged, skipped")
+                continue
+
+            stage = stageCsv(conn, tableName, dataDir/fileName, columns, keys)
+            written = upsertFromStage(conn, tableName, stage, columns, keys)
+            changedFiles[tableName] = (fileName, csvHash, written)
+
+        removed = {tableName: 0 for tableName in changedFiles}
+        kept = {tableName: 0 for tableName in changedFiles}
+
+        # links first, so books and authors they point at can go too
+        if "BOOK_AUTHORS" in changedFiles:
+            cur.execute("""
+                        DELETE FROM BOOK_AUTHORS
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM temp.SYNC_BOOK_AUTHORS S
+                            WHERE S.Isbn = BOOK_AUTHORS.Isbn
+                              AND S.Author_id = BOOK_AUTHORS.Author_id
+                        );""")
+            removed["BOOK_AUTHORS"] = cur.rowcount
+
+        # books that were ever lent stay, their loan history points at them
+        if "BOOK" in changedFiles:
+            cur.execute("""
+                        CREATE TEMP TABLE SYNC_BOOK_GONE AS
+                        SELECT Isbn FROM BOOK
+                        WHERE Isbn NOT IN (SELECT Isbn FROM temp.SYNC_BOOK)
+                          AND Isbn NOT IN (SELECT Isbn FROM BOOK_LOANS);""")
+            cur.execute("DELETE FROM BOOK_AUTHORS WHERE Isbn IN (SELECT Isbn FROM temp.SYNC_BOOK_GONE);")
+            droppedLinks = cur.rowcount
+            cur.execute("DELETE FROM BOOK WHERE Isbn IN (SELECT Isbn FROM temp.SYNC_BOOK_GONE);")
+            removed["BOOK"] = cur.rowcount
+            cur.execute("""
+                        SELECT COUNT(*) FROM BOOK
+                        WHERE Isbn NOT IN (SELECT Isbn FROM temp.SYNC_BOOK);""")
+            kept["BOOK"] = cur.fetchone()[0]
+            cur.execute("DROP TABLE temp.SYNC_BOOK_GONE;")
+
+        # authors still linked to a book stay
+        if "AUTHORS" in changedFiles:
+            cur.execute("""
+                        DELETE FROM AUTHORS
+                        WHERE Author_id NOT IN (SELECT Author_id FROM temp.SYNC_AUTHORS)
+                          AND Author_id NOT IN (SELECT Author_id FROM BOOK_AUTHORS);""")
+            removed["AUTHORS"] = cur.rowcount
+            cur.execute("""
+                        SELECT COUNT(*) FROM AUTHORS
+                        WHERE Author_id NOT IN (SELECT Author_id FROM temp.SYNC_AUTHORS);""")
+            kept["AUTHORS"] = cur.fetchone()[0]
+
+        for tableName, (fileName, csvHash, written) in changedFiles.items():
+            setMeta(conn, f"csv_sha256:{fileName}", csvHash)
+            cur.execute(f"DROP TABLE temp.SYNC_{tableName};")
+            message = f"{fileName}: {written} added or updated, {removed[tableName]} removed"
+            if kept[tableName]:
+                message += f", {kept[tableName]} missing from the file but kept (still referenced)"
+            print(message)
+
+        # book_authors.csv no longer matches the table; re-read it next time
+        if droppedLinks:
+            cur.execute("DELETE FROM LIBRARY_META WHERE Key = 'csv_sha256:book_authors.csv';")
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def syncDb():
     conn = getConnection()
     createTables(conn)
-    importData(conn)
+    syncCatalog(conn)
     conn.close()
+
+def initDb(dbPath=DB_PATH, dataDir=DATA_DIR):
+    conn = getConnection(dbPath)
+    if isNewDatabase(conn):
+        conn.close()
+        buildDatabase(dbPath, dataDir)
+    else:
+        createTables(conn)
+        importData(conn, dataDir)
+        conn.close()
     print("test")
 
 if __name__ == "__main__":
-    initDb()
+    parser = argparse.ArgumentParser(description="Create library.db and load the csv files in data/.")
+    parser.add_argument("--sync", action="store_true",
+                        help="update an existing database from changed catalog csv files")
+    args = parser.parse_args()
+    if args.sync:
+        syncDb()
+    else:
+        initDb()
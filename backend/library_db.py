@@ -1,18 +1,82 @@
+import json
 import sqlite3
+import string
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from enum import Enum
+
+from connection_pool import ConnectionPool
+from init_db import rebuildBorrowerAccounts
+from statements import sql
+
+# Number of search pages kept in LibraryDB's result cache
+SEARCH_CACHE_SIZE = 128
+
+# Separates author names inside search rows (joined with ", " for display)
+AUTHOR_SEPARATOR = "\x1f"
+
+# SQLite's LIKE only folds ASCII letters, so in-memory matching must do the same
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+class CheckoutResult(Enum):
+    """Outcome of LibraryDB.checkout_book; only OK is truthy."""
+    OK = "Checkout successful"
+    BORROWER_NOT_FOUND = "Borrower does not exist"
+    FINES_DUE = "Borrower has fines due"
+    MAX_LOANS = "Borrower has reached the maximum loans permissible"
+    BOOK_NOT_FOUND = "Book does not exist"
+    ALREADY_OUT = "Book has been checked out"
+
+    def __bool__(self):
+        return self is CheckoutResult.OK
+
 
 class LibraryDB:
-    def __init__(self, db_path):
+    """
+    Library operations over a ConnectionPool: searches and reports run on
+    the pool's read-only connections, everything that writes on its single
+    writer connection.
+
+    With readers > 0 one LibraryDB can be shared by several threads, and
+    searches keep running while a checkout or update_fines is writing.
+    conn / cur are the writer connection and its cursor, for callers that
+    use the database directly from one thread (scripts, tests).
+    """
+
+    def __init__(self, db_path, readers=0, quiet=False):
         # Save the DB file path
         self.db_path = db_path
 
-        # Connect to SQLite database
-        self.conn = sqlite3.connect(self.db_path)
+        # quiet=True drops the status messages the methods print (e.g. for a
+        # service, where the return values carry the outcome)
+        self.quiet = quiet
+
+        # Connect to SQLite database (settings in connection_pool.connect)
+        self.pool = ConnectionPool(self.db_path, readers)
+        self.conn = self.pool.writer_conn
 
         # Create a cursor for executing SQL queries
         self.cur = self.conn.cursor()
 
-        # Enable foreign key enforcement
-        self.conn.execute("PRAGMA foreign_keys = ON;")
+        # per thread: the _guard_commits gate its writes commit through
+        self.commit_gates = threading.local()
+
+        # LRU cache of search_books rows, see _cached_search. Keys are
+        # ("page", query, limit, after_key) or ("all", query). epoch moves
+        # on every clear, so rows read before a clear are never stored after it
+        self.search_cache = OrderedDict()
+        self.search_cache_lock = threading.Lock()
+        self.search_cache_versions = {}
+        self.search_cache_epoch = 0
+
+    def close(self):
+        self.pool.close()
+
+    def _say(self, message):
+        if not self.quiet:
+            print(message)
 
     # -------------------------------------------------
     # Borrower creation
@@ -35,48 +99,44 @@ class LibraryDB:
         if not password:
             return None
 
-        # Check SSN uniqueness
-        self.cur.execute("SELECT 1 FROM BORROWER WHERE Ssn = ?", (ssn,))
-        if self.cur.fetchone() is not None:
-            print("ERROR: A borrower with this SSN already exists.")
-            return None
-
-        # Generate next Card_id based on max existing
-        self.cur.execute("SELECT MAX(Card_id) FROM BORROWER;")
-        row = self.cur.fetchone()
-        max_card = row[0]
-
-        if max_card is None:
-            next_num = 1
-        else:
-            try:
-                next_num = int(max_card[2:]) + 1
-            except ValueError:
-                # Fallback if existing IDs are weird
+        # The checks and the insert share a write transaction, so two
+        # stations can't hand out the same Card_id
+        with self._write_transaction():
+            # Check SSN uniqueness
+            self.cur.execute(sql("borrower_ssn_exists"), (ssn,))
+            if self.cur.fetchone() is not None:
+                self._say("ERROR: A borrower with this SSN already exists.")
+                return None
+
+            # Generate next Card_id based on max existing
+            self.cur.execute(sql("max_card_id"))
+            row = self.cur.fetchone()
+            max_card = row[0]
+
+            if max_card is None:
                 next_num = 1
+            else:
+                try:
+                    next_num = int(max_card[2:]) + 1
+                except ValueError:
+                    # Fallback if existing IDs are weird
+                    next_num = 1
 
-        card_id = f"ID{next_num:06d}"
-        
-        self.cur.execute(
-            """
-            INSERT INTO BORROWER (Card_id, Ssn, Bname, Address, Phone, Password)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (card_id, ssn, name, address, phone, password),
-        )
-        self.conn.commit()
-        print(f"Borrower created with Card_id={card_id}")
+            card_id = f"ID{next_num:06d}"
+
+            self.cur.execute(
+                sql("insert_borrower"),
+                (card_id, ssn, name, address, phone, password),
+            )
+        self._say(f"Borrower created with Card_id={card_id}")
         return card_id
     
     # Authenticate the borrower
     def authenticate_borrower(self, card_id: str, password: str):
         card_id = card_id.strip()
         password = password.strip()
-        self.cur.execute(
-            "SELECT Card_id, Bname FROM BORROWER WHERE Card_id = ? AND PASSWORD = ?",
-            (card_id, password),
-        )
-        row = self.cur.fetchone()
+        with self.pool.reader() as conn:
+            row = conn.execute(sql("authenticate_borrower"), (card_id, password)).fetchone()
         if row is None:
             return None
         return {"card_id": row[0], "name": row[1]}
@@ -84,184 +144,375 @@ class LibraryDB:
     # -------------------------------------------------
     # Search books
     # -------------------------------------------------
-    def search_books(self, query):
-        search = f"%{query.lower()}%"
-
-        sql = """
-        SELECT
-            B.Isbn,
-            B.Title,
-            GROUP_CONCAT(A.Name, ', ') AS Authors,
-            CASE
-                WHEN EXISTS (
-                    SELECT 1 FROM BOOK_LOANS BL
-                    WHERE BL.Isbn = B.Isbn
-                    AND BL.Date_in IS NULL
-                ) THEN 'OUT'
-                ELSE 'IN'
-            END AS Status
-        FROM BOOK B
-        LEFT JOIN BOOK_AUTHORS BA ON B.Isbn = BA.Isbn
-        LEFT JOIN AUTHORS A ON BA.Author_id = A.Author_id
-        WHERE
-            LOWER(B.Isbn) LIKE ?
-            OR LOWER(B.Title) LIKE ?
-            OR LOWER(A.Name) LIKE ?
-        GROUP BY B.Isbn;
-        """
-
-        self.cur.execute(sql, (search, search, search))
-        rows = self.cur.fetchall()
+    def search_books(self, query, include_holder=False, limit=None, after_key=None):
+        """
+        Search BOOK for a case-insensitive substring of the ISBN, the title
+        or any author name. Results are ordered by ISBN.
+
+        With include_holder=True each result also carries "holder": the
+        Card_id of the borrower who currently has the book ("" when IN).
+
+        Pagination is keyset based: pass limit to cap the page size and
+        after_key (the "isbn" of the last row of the previous page) to
+        continue after it. See iter_search_books for a streaming variant.
+
+        Matching goes through the trigram indexes (BOOK_FTS / AUTHOR_FTS),
+        which answer the same LIKE '%query%' test as a table scan would;
+        queries the index can't answer fall back to that scan. A page of a
+        broad query (or of one the index can't answer) instead tests books
+        in ISBN order and stops once the page is full.
+
+        Results are cached per normalized query and page; repeated searches
+        and searches that extend an earlier, complete one (e.g. "harr" after
+        "har") are answered from memory. Any write to the database clears it.
+        """
+        normalized = query.lower()
+        with self.pool.reader() as conn:
+            epoch = self._check_search_cache(conn)
+            rows = self._cached_search(normalized, limit, after_key)
+            if rows is None:
+                rows = self._query_books(conn, query, limit, after_key)
+                self._store_search(normalized, limit, after_key, rows, epoch)
+        return self._book_rows_to_dicts(rows, include_holder)
+
+    def _query_books(self, conn, query, limit, after_key):
+        if not query:
+            # An empty query lists every book, straight off the ISBN index
+            statement = sql("search_books", matches="nothing", matched="all_books")
+        elif limit is not None and self._is_broad_query(conn, query, limit):
+            statement = sql("search_books", matches="nothing", matched="tested_books")
+        elif self._can_use_trigram_index(query):
+            statement = sql("search_books", matches="trigram_book_matches", matched="matched_books")
+        else:
+            statement = sql("search_books", matches="scan_book_matches", matched="matched_books")
+
+        return conn.execute(statement, {
+            "search": f"%{query.lower()}%",
+            "after_key": "" if after_key is None else after_key,
+            # LIMIT -1 means no limit in SQLite
+            "limit": -1 if limit is None else limit,
+        }).fetchall()
+
+    def iter_search_books(self, query, include_holder=False, page_size=500):
+        """
+        Generator over the same results as search_books, fetched one
+        keyset page at a time so memory stays bounded for broad queries.
+        """
+        after_key = None
+        while True:
+            page = self.search_books(query, include_holder, limit=page_size, after_key=after_key)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_key = page[-1]["isbn"]
+
+    def _is_broad_query(self, conn, query, limit):
+        """
+        Whether a page of query is cheaper to find by testing books in ISBN
+        order than by collecting every match first. Testing reads about
+        limit * books / matches books, collecting reads every match, so
+        testing wins once matches exceed sqrt(limit * books). Queries the
+        trigram index can't answer would be scanned in full either way.
+        The match count is bounded by the trigram vocabularies, which only
+        read index entries.
+        """
+        if not self._can_use_trigram_index(query):
+            return True
+        lowered = query.lower()
+        trigrams = sorted({lowered[i:i + 3] for i in range(len(lowered) - 2)})
+        books, book_matches, author_matches = conn.execute(
+            sql("search_match_estimate"), {"trigrams": json.dumps(trigrams)},
+        ).fetchone()
+        matches = book_matches + author_matches
+        return matches * matches > limit * books
+
+    @staticmethod
+    def _can_use_trigram_index(query):
+        """
+        The trigram index can only answer plain substrings of at least three
+        characters; shorter queries and LIKE wildcards (% and _) are left to
+        a regular LIKE scan so results never differ.
+        """
+        return len(query) >= 3 and "%" not in query and "_" not in query
+
+    # -------------------------------------------------
+    # Search result cache
+    # -------------------------------------------------
+    def clear_search_cache(self):
+        with self.search_cache_lock:
+            self.search_cache.clear()
+            self.search_cache_epoch += 1
+
+    def _check_search_cache(self, conn):
+        """
+        Drop cached searches if the database changed since conn last looked:
+        data_version moves when another connection commits, total_changes
+        when conn itself writes. Each pooled connection keeps its own
+        counters, so each is compared with what it saw before.
+        Returns the cache epoch that rows read now may be stored under.
+        """
+        data_version = conn.execute(sql("data_version")).fetchone()[0]
+        version = (data_version, conn.total_changes)
+        with self.search_cache_lock:
+            if self.search_cache_versions.get(conn) != version:
+                self.search_cache.clear()
+                self.search_cache_epoch += 1
+                self.search_cache_versions[conn] = version
+            return self.search_cache_epoch
+
+    def _cached_search(self, normalized, limit, after_key):
+        with self.search_cache_lock:
+            key = ("page", normalized, limit, after_key)
+            rows = self.search_cache.get(key)
+            if rows is not None:
+                self.search_cache.move_to_end(key)
+                return rows
+
+            complete = self._complete_search_rows(normalized)
+        if complete is None:
+            return None
+        if after_key is not None:
+            complete = [row for row in complete if row[0] > after_key]
+        return complete if limit is None else complete[:limit]
 
+    def _complete_search_rows(self, normalized):
+        """
+        All rows for a query, if known: either cached directly, or filtered
+        from a cached complete result of a query it contains (every book
+        matching "harry" also matches "har"). Caller holds search_cache_lock.
+        """
+        key = ("all", normalized)
+        rows = self.search_cache.get(key)
+        if rows is not None:
+            self.search_cache.move_to_end(key)
+            return rows
+
+        if "%" in normalized or "_" in normalized:
+            return None
+
+        base = None
+        for cached_key, cached_rows in self.search_cache.items():
+            if (
+                cached_key[0] == "all"
+                and cached_key[1] in normalized
+                and "%" not in cached_key[1]
+                and "_" not in cached_key[1]
+                and (base is None or len(cached_rows) < len(base))
+            ):
+                base = cached_rows
+        if base is None:
+            return None
+
+        rows = [row for row in base if self._row_matches(row, normalized)]
+        self._cache_put(key, rows)
+        return rows
+
+    @staticmethod
+    def _row_matches(row, normalized):
+        # Same test as LOWER(col) LIKE '%query%' for a wildcard-free query
+        isbn, title, authors = row[0], row[1], row[2] or ""
+        return (
+            normalized in isbn.translate(ASCII_LOWER)
+            or normalized in title.translate(ASCII_LOWER)
+            or any(
+                normalized in name.translate(ASCII_LOWER)
+                for name in authors.split(AUTHOR_SEPARATOR)
+            )
+        )
+
+    def _store_search(self, normalized, limit, after_key, rows, epoch):
+        with self.search_cache_lock:
+            # the cache was cleared while these rows were read
+            if epoch != self.search_cache_epoch:
+                return
+
+            self._cache_put(("page", normalized, limit, after_key), rows)
+
+            # A first page shorter than the limit is the whole result
+            if after_key is None and (limit is None or len(rows) < limit):
+                self._cache_put(("all", normalized), rows)
+
+    def _cache_put(self, key, rows):
+        self.search_cache[key] = rows
+        self.search_cache.move_to_end(key)
+        while len(self.search_cache) > SEARCH_CACHE_SIZE:
+            self.search_cache.popitem(last=False)
+
+    @staticmethod
+    def _book_rows_to_dicts(rows, include_holder=False):
         results = []
         for row in rows:
-            results.append({
+            book = {
                 "isbn": row[0],
                 "title": row[1],
-                "authors": row[2] if row[2] else "",
+                "authors": ", ".join(row[2].split(AUTHOR_SEPARATOR)) if row[2] else "",
                 "status": row[3]
-            })
+            }
+            if include_holder:
+                book["holder"] = row[4] if row[4] else ""
+            results.append(book)
         return results
 
     # -------------------------------------------------
     # Checkout
     # -------------------------------------------------
     def checkout_book(self, isbn, card_id):
-        isbn = isbn.strip().upper()
-        card_id = card_id.strip()
-
-        # make sure the borrower exists
-        self.cur.execute("""
-            SELECT *
-            FROM BORROWER
-            WHERE Card_id = ?;
-        """, (card_id,))
-        borrower = self.cur.fetchone()
-        if borrower is None:
-            print("ERROR: Borrower does not exist")
-            return False
+        """
+        Check out isbn to card_id with a 14 day due date.
 
-        # checking if the borrower has fines due
-        self.cur.execute("""
-            SELECT SUM(Fine_amt)
-            FROM FINES F
-            JOIN BOOK_LOANS BL ON F.Loan_id = BL.Loan_id
-            WHERE BL.Card_id = ?
-              AND F.Paid = 0
-        """, (card_id,))
-        due_fines = self.cur.fetchone()[0]
-        if due_fines is not None and due_fines > 0:
-            print(f"ERROR: Borrower has fines due (${due_fines:.2f})")
-            return False
+        The eligibility checks and the insert run in one BEGIN IMMEDIATE
+        transaction, so two stations can't both lend the same copy; the
+        unique index on active loans backs this up.
+        Returns a CheckoutResult (truthy only when the loan was created).
+        """
+        return self.checkout_books([(card_id, isbn)])[0]
 
-        # checking if the borrower has less than 3 active loans
-        self.cur.execute("""
-        SELECT COUNT(*)
-        FROM BOOK_LOANS
-        WHERE Card_id = ?
-          AND Date_in IS NULL
-        """, (card_id,))
-        active_loans = self.cur.fetchone()[0]
-        if active_loans >= 3:
-            print("ERROR: Borrower has reached the maximum loans permissible")
-            return False
+    def checkout_books(self, card_ids_isbns):
+        """
+        Check out a cart of (card_id, isbn) pairs in one transaction.
 
-        # checking if the book exists
-        self.cur.execute("SELECT * FROM BOOK WHERE Isbn = ?", (isbn,))
-        book = self.cur.fetchone()
-        if book is None:
-            print("ERROR: Book does not exist.")
-            return False
+        Items are checked in order, each seeing the loans made by the ones
+        before it, so the 3-loan limit holds across the whole cart and an
+        ISBN listed twice is only lent once. Items that fail are skipped;
+        the rest are committed together.
+        Returns a CheckoutResult per item, in the same order.
+        """
+        with self._write_transaction():
+            results = [
+                self._checkout_one(card_id.strip(), isbn.strip().upper())
+                for card_id, isbn in card_ids_isbns
+            ]
+
+        if CheckoutResult.OK in results:
+            # cached searches hold the books' old IN/OUT status
+            self.clear_search_cache()
+        return results
 
-        # checking the book's availability
-        self.cur.execute("""
-        SELECT * FROM BOOK_LOANS
-        WHERE Isbn = ?
-          AND Date_in IS NULL
-        """, (isbn,))
-        loan = self.cur.fetchone()
-        if loan is not None:
-            print("ERROR: Book has been checked out.")
-            return False
+    def _checkout_one(self, card_id, isbn):
+        # Caller holds the write transaction.
+        # BORROWER_ACCOUNT already counts loans made earlier in the transaction
+        self.cur.execute(sql("checkout_checks"), {"isbn": isbn, "card_id": card_id})
+        active_loans, due_fines, book_exists, book_out = self.cur.fetchone()
 
-        # the book is checked out and a 14 day due date is assigned
-        self.cur.execute("""
-        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
-        VALUES (?, ?, DATE('now'), DATE('now', '+14 days'), NULL)
-        """, (isbn, card_id))
-        self.conn.commit()
-        print("Checkout successful")
-        return True
+        if active_loans is None:
+            return CheckoutResult.BORROWER_NOT_FOUND
+        if due_fines > 0:
+            return CheckoutResult.FINES_DUE
+        if active_loans >= 3:
+            return CheckoutResult.MAX_LOANS
+        if not book_exists:
+            return CheckoutResult.BOOK_NOT_FOUND
+        if book_out:
+            return CheckoutResult.ALREADY_OUT
+
+        try:
+            self.cur.execute(sql("insert_loan"), (isbn, card_id))
+        except sqlite3.IntegrityError:
+            # another connection lent it without taking the write lock
+            return CheckoutResult.ALREADY_OUT
+        return CheckoutResult.OK
+
+    @contextmanager
+    def _write_transaction(self):
+        # Holds the pool's writer for the whole transaction. BEGIN IMMEDIATE
+        # takes the database write lock before the first read, so nothing
+        # can change between the checks and the write.
+        # Commits on exit (including early returns), rolls back on errors.
+        with self.pool.writer():
+            self.pool.begin_write()
+            try:
+                yield
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self._commit()
+
+    def _commit(self):
+        gate = getattr(self.commit_gates, "gate", None)
+        if gate is None:
+            self.conn.commit()
+            return
+        # stop() takes the same lock, so it lands either before this check
+        # (nothing commits) or after the commit (the write stands)
+        with gate.lock:
+            if gate.stopped:
+                self.conn.rollback()
+                raise sqlite3.OperationalError("interrupted")
+            self.conn.commit()
+
+    @contextmanager
+    def _guard_commits(self, gate):
+        """
+        While inside, writes on this thread commit only if gate.stopped is
+        still False, checked under gate.lock; otherwise they roll back and
+        raise OperationalError("interrupted"). Lets a caller that gave up on
+        the work (AsyncLibraryDB on timeout) rely on it not committing later.
+        """
+        self.commit_gates.gate = gate
+        try:
+            yield
+        finally:
+            self.commit_gates.gate = None
 
         # -------------------------------------------------
     # Check-in (interactive: search + select up to 3)
     # -------------------------------------------------
     def checkin_book(self, query, selections):
-        search = f"%{query.lower()}%"
-
-        sql = """
-        SELECT BL.Loan_id, BL.Isbn, B.Title, BL.Card_id, BR.Bname, BL.Date_out, BL.Due_date
-        FROM BOOK_LOANS BL
-        JOIN BOOK B ON BL.Isbn = B.Isbn
-        JOIN BORROWER BR ON BL.Card_id = BR.Card_id
-        WHERE BL.Date_in IS NULL
-        AND (LOWER(BL.Isbn) LIKE ?
-            OR LOWER(BL.Card_id) LIKE ?
-            OR LOWER(BR.Bname) LIKE ?)
-        ORDER BY BL.Date_out;
-        """
-
-        self.cur.execute(sql, (search, search, search))
-        rows = self.cur.fetchall()
+        results = self.find_loans_for_checkin(query)
 
         # No matching loans
-        if len(rows) == 0:
-            print("No active loans match this search.")
+        if len(results) == 0:
+            self._say("No active loans match this search.")
             return False
 
-        # Convert rows to dictionaries
-        results = []
-        for row in rows:
-            results.append({
-                "loan_id": row[0],
-                "isbn": row[1],
-                "title": row[2],
-                "card_id": row[3],
-                "borrower_name": row[4],
-                "date_out": row[5],
-                "due_date": row[6]
-            })
-
         # Validate selections are 1-based row numbers
         if len(selections) == 0:
-            print("Error: No selections provided.")
+            self._say("Error: No selections provided.")
             return False
 
         if len(selections) > 3:
-            print("Error: Cannot check in more than 3 books.")
+            self._say("Error: Cannot check in more than 3 books.")
             return False
 
         if any(s < 1 or s > len(results) for s in selections):
-            print("Error: Selection number out of range.")
+            self._say("Error: Selection number out of range.")
             return False
 
         # Map selections (1-based index) to loan_ids
         loan_ids = [results[s-1]["loan_id"] for s in selections]
+        return self.checkin_loans(loan_ids) > 0
+
+    def checkin_loans(self, loan_ids):
+        """
+        Check in the given loans (e.g. rows picked from find_loans_for_checkin)
+        and compute fines for just those loans, all in one transaction.
+
+        Loans that were already checked in are left alone.
+        Returns the number of loans checked in.
+        """
+        loan_ids = list(dict.fromkeys(loan_ids))
+        if len(loan_ids) == 0:
+            self._say("Error: No selections provided.")
+            return 0
 
-        # Check in each selected loan
-        for loan_id in loan_ids:
-            self.cur.execute("""
-                UPDATE BOOK_LOANS
-                SET Date_in = DATE('now')
-                WHERE Loan_id = ?
-            """, (loan_id,))
-        self.conn.commit()
+        if len(loan_ids) > 3:
+            self._say("Error: Cannot check in more than 3 books.")
+            return 0
 
-        # Update fines after check-in
-        self.update_fines()
+        with self._write_transaction():
+            self.cur.execute(sql("checkin_loans"), (json.dumps(loan_ids),))
+            checked_in = self.cur.rowcount
 
-        print("Books successfully checked in.")
-        return True
+            # Only the loans just closed can have a new fine
+            self._accrue_fines("loan_ids", (json.dumps(loan_ids),))
+
+        if checked_in == 0:
+            self._say("None of the selected loans are still checked out.")
+            return 0
+
+        self.clear_search_cache()
+        self._say("Books successfully checked in.")
+        return checked_in
 
     
         # -------------------------------------------------
@@ -280,38 +531,26 @@ class LibraryDB:
             "loan_id": int,
             "isbn": str,
             "title": str,
+            "authors": str,   # comma-separated author names
             "card_id": str,
             "borrower_name": str,
             "date_out": str,
             "due_date": str,
           }
         """
-        search = f"%{query.lower()}%"
-
-        sql = """
-        SELECT
-            BL.Loan_id,
-            BL.Isbn,
-            B.Title,
-            BL.Card_id,
-            BR.Bname,
-            BL.Date_out,
-            BL.Due_date
-        FROM BOOK_LOANS BL
-        JOIN BOOK B ON BL.Isbn = B.Isbn
-        JOIN BORROWER BR ON BL.Card_id = BR.Card_id
-        WHERE
-            BL.Date_in IS NULL
-            AND (
-                LOWER(B.Isbn)   LIKE ?
-                OR LOWER(BL.Card_id) LIKE ?
-                OR LOWER(BR.Bname)   LIKE ?
-            )
-        ORDER BY BL.Date_out;
-        """
+        loan_filter = "nothing"
+        if query:
+            if self._can_use_trigram_index(query):
+                # Substring matches are resolved through the trigram indexes
+                loan_filter = "trigram_loan_filter"
+            else:
+                loan_filter = "scan_loan_filter"
 
-        self.cur.execute(sql, (search, search, search))
-        rows = self.cur.fetchall()
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                sql("loans_for_checkin", loan_filter=loan_filter),
+                {"search": f"%{query.lower()}%"},
+            ).fetchall()
 
         results = []
         for row in rows:
@@ -323,6 +562,7 @@ class LibraryDB:
                 "borrower_name": row[4],
                 "date_out":      row[5],
                 "due_date":      row[6],
+                "authors":       row[7] if row[7] else "",
             })
 
         return results
@@ -331,9 +571,9 @@ class LibraryDB:
     # -------------------------------------------------
     # Update fines
     # -------------------------------------------------
-    def update_fines(self):
+    def update_fines(self, incremental=False, loan_ids=None):
         """
-        Recalculate fines for all overdue loans.
+        Recalculate fines for overdue loans.
 
         Rules:
         - Returned late:
@@ -344,73 +584,116 @@ class LibraryDB:
             - If Paid == 0, update Fine_amt.
             - If Paid == 1, leave it alone.
         - If no FINES row exists, insert one with Paid = 0.
+
+        By default every loan is recalculated. With incremental=True only
+        loans whose fine can have changed since the last run are: loans
+        created or returned since then, plus loans still out once the date
+        has moved on. loan_ids limits the run to those loans (used by
+        check-in for the loans it just closed).
         """
+        with self._write_transaction():
+            if loan_ids is not None:
+                loan_ids = list(loan_ids)
+                if loan_ids:
+                    self._accrue_fines("loan_ids", (json.dumps(loan_ids),))
+            else:
+                self._accrue_changed_fines(incremental)
+        self._say("Fines updated.")
 
-        # 1) Late books that have been returned
-        self.cur.execute("""
-            SELECT
-                Loan_id,
-                ROUND(
-                    CAST(julianday(Date_in) - julianday(Due_date) AS INTEGER) * 0.25,
-                    2
-                ) AS Fine
-            FROM BOOK_LOANS
-            WHERE Date_in IS NOT NULL
-            AND julianday(Date_in) > julianday(Due_date)
-        """)
-        returned_rows = self.cur.fetchall()
-
-        # 2) Late books still out
-        self.cur.execute("""
-            SELECT
-                Loan_id,
-                ROUND(
-                    CAST(julianday('now') - julianday(Due_date) AS INTEGER) * 0.25,
-                    2
-                ) AS Fine
-            FROM BOOK_LOANS
-            WHERE Date_in IS NULL
-            AND julianday('now') > julianday(Due_date)
-        """)
-        out_rows = self.cur.fetchall()
-
-        self._apply_fines(returned_rows)
-        self._apply_fines(out_rows)
-
-        self.conn.commit()
-        print("Fines updated.")
-
-
-    def _apply_fines(self, fine_rows):
-        """
-        Internal helper to apply fines rows: list of (loan_id, fine_amt)
-        to the FINES table respecting Paid flag.
-        """
-        for loan_id, fine_amt in fine_rows:
-            if fine_amt is None or fine_amt <= 0:
-                continue
+    def _accrue_changed_fines(self, incremental):
+        # Caller holds the write transaction
+        today = self.cur.execute(sql("today")).fetchone()[0]
+        accrued_on = self._get_meta("fines_accrued_on")
+        accrued_loan_id = self._get_meta("fines_accrued_loan_id")
 
-            self.cur.execute(
-                "SELECT Fine_amt, Paid FROM FINES WHERE Loan_id = ?",
-                (loan_id,)
+        if not incremental or accrued_on is None or accrued_loan_id is None:
+            self._accrue_fines()
+        else:
+            self._accrue_fines(
+                "loans_after_or_returned_since",
+                (int(accrued_loan_id), accrued_on),
             )
-            existing = self.cur.fetchone()
+            # Fines only grow when the day changes, so loans still out can
+            # be skipped until then
+            if today > accrued_on:
+                self._accrue_fines("loans_still_out")
+
+        self.cur.execute(sql("max_loan_id"))
+        self._set_meta("fines_accrued_loan_id", self.cur.fetchone()[0])
+        self._set_meta("fines_accrued_on", today)
 
-            if existing is None:
-                # Create new fine
+    def iter_accrue_fines(self, chunk_size=5000, restart=False):
+        """
+        Recalculate every loan's fine in chunks of chunk_size loans,
+        committing after each chunk so other connections are never blocked
+        for long. Yields (loans_done, loans_total) once before the first
+        chunk, so a resumed run reports where it picked up, and again after
+        each commit.
+
+        Progress is kept in LIBRARY_META, so a run that is interrupted picks
+        up after the last committed chunk the next time it is started
+        (unless restart=True). A finished run counts as a full update_fines
+        for later incremental runs.
+        """
+        # The writer is only held while a chunk is written, never across a yield
+        with self._write_transaction():
+            started_on = self._get_meta("fines_batch_started_on")
+            if restart or started_on is None:
+                self.cur.execute(sql("today_and_max_loan_id"))
+                started_on, end_loan_id = self.cur.fetchone()
+                self._set_meta("fines_batch_started_on", started_on)
+                self._set_meta("fines_batch_end_loan_id", end_loan_id)
+                self._set_meta("fines_batch_loan_id", 0)
+
+            end_loan_id = int(self._get_meta("fines_batch_end_loan_id"))
+            after_loan_id = int(self._get_meta("fines_batch_loan_id"))
+
+            self.cur.execute(sql("count_loans_through"), (end_loan_id,))
+            loans_total = self.cur.fetchone()[0]
+            self.cur.execute(sql("count_loans_through"), (after_loan_id,))
+            loans_done = self.cur.fetchone()[0]
+        yield loans_done, loans_total
+
+        while after_loan_id < end_loan_id:
+            # The fines and the progress marker commit together
+            with self._write_transaction():
                 self.cur.execute(
-                    "INSERT INTO FINES (Loan_id, Fine_amt, Paid) VALUES (?, ?, 0)",
-                    (loan_id, fine_amt)
+                    sql("chunk_end_loan_id"), (after_loan_id, end_loan_id, chunk_size - 1)
                 )
-            else:
-                existing_fine, paid = existing
-                if paid == 0:
-                    if existing_fine is None or float(existing_fine) != float(fine_amt):
-                        self.cur.execute(
-                            "UPDATE FINES SET Fine_amt = ? WHERE Loan_id = ?",
-                            (fine_amt, loan_id)
-                        )
-                # If paid == 1: leave it unchanged
+                row = self.cur.fetchone()
+                chunk_end = row[0] if row else end_loan_id
+
+                self.cur.execute(sql("count_loans_between"), (after_loan_id, chunk_end))
+                chunk_loans = self.cur.fetchone()[0]
+
+                self._accrue_fines("loan_id_range", (after_loan_id, chunk_end))
+                self._set_meta("fines_batch_loan_id", chunk_end)
+
+            after_loan_id = chunk_end
+            loans_done += chunk_loans
+            yield loans_done, loans_total
+
+        # Loans created or returned since the run started are left to the
+        # next incremental update_fines
+        with self._write_transaction():
+            self._set_meta("fines_accrued_on", started_on)
+            self._set_meta("fines_accrued_loan_id", end_loan_id)
+            self.cur.execute(sql("clear_fines_batch"))
+
+    def _accrue_fines(self, loan_filter="every_loan", params=()):
+        # Upsert fines for the late loans matching loan_filter, the name of
+        # a condition on BOOK_LOANS in statements.FRAGMENTS ("loan_ids" takes
+        # the ids as a JSON array)
+        self.cur.execute(sql("accrue_fines", loan_filter=loan_filter), params)
+
+    def _get_meta(self, key):
+        self.cur.execute(sql("get_meta"), (key,))
+        row = self.cur.fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        # Caller holds the write transaction
+        self.cur.execute(sql("set_meta"), (key, str(value)))
 
     # -------------------------------------------------
     # Pay fines
@@ -425,35 +708,64 @@ class LibraryDB:
         """
         card_id = card_id.strip()
 
-        # Sum unpaid fines for this borrower where the book has been returned
-        self.cur.execute("""
-            SELECT SUM(F.Fine_amt)
-            FROM FINES F
-            JOIN BOOK_LOANS BL ON F.Loan_id = BL.Loan_id
-            WHERE BL.Card_id = ?
-              AND F.Paid = 0
-              AND BL.Date_in IS NOT NULL
-        """, (card_id,))
-        total = self.cur.fetchone()[0]
-
-        if total is None or total <= 0:
-            print("No fines to pay for this borrower.")
-            return 0.0
-
-        # Mark those fines as paid
-        self.cur.execute("""
-            UPDATE FINES
-            SET Paid = 1
-            WHERE Loan_id IN (
-                SELECT BL.Loan_id
-                FROM BOOK_LOANS BL
-                JOIN FINES F ON F.Loan_id = BL.Loan_id
-                WHERE BL.Card_id = ?
-                  AND F.Paid = 0
-                  AND BL.Date_in IS NOT NULL
-            )
-        """, (card_id,))
-        self.conn.commit()
+        with self._write_transaction():
+            # Sum unpaid fines for this borrower where the book has been returned
+            self.cur.execute(sql("payable_fines_total"), (card_id,))
+            total = self.cur.fetchone()[0]
 
-        print(f"Paid ${total:.2f} in fines for Card_id={card_id}.")
+            if total is None or total <= 0:
+                self._say("No fines to pay for this borrower.")
+                return 0.0
+
+            # Mark those fines as paid
+            self.cur.execute(sql("pay_fines"), (card_id,))
+
+        self._say(f"Paid ${total:.2f} in fines for Card_id={card_id}.")
         return float(total)
+
+    # -------------------------------------------------
+    # Borrower accounts
+    # -------------------------------------------------
+    def repair_borrower_accounts(self):
+        """
+        Recompute BORROWER_ACCOUNT (active loan count and unpaid fine total
+        per borrower) from BOOK_LOANS and FINES, fixing any rows that have
+        drifted, e.g. after loans were edited with triggers dropped.
+        Returns the number of rows corrected.
+        """
+        with self.pool.writer():
+            fixed = rebuildBorrowerAccounts(self.conn)
+        self._say(f"Borrower accounts checked: {fixed} corrected.")
+        return fixed
+
+    # -------------------------------------------------
+    # Reports
+    # -------------------------------------------------
+    def search_fines(self, query: str, include_paid: bool = False):
+        """
+        Total fines per borrower, for borrowers whose Card_id or name
+        contains query (all borrowers when query is empty).
+
+        Only unpaid fines are counted unless include_paid is True.
+        Returns a list of (card_id, name, total_fine) tuples ordered by Card_id.
+        """
+        query = query.strip().lower()
+        borrower_filter = "nothing"
+        if self._can_use_trigram_index(query):
+            borrower_filter = "trigram_borrower_filter"
+        elif query:
+            borrower_filter = "scan_borrower_filter"
+
+        name = "fine_totals" if include_paid else "unpaid_fine_totals"
+        with self.pool.reader() as conn:
+            return conn.execute(
+                sql(name, borrower_filter=borrower_filter), {"search": f"%{query}%"}
+            ).fetchall()
+
+    def list_active_loans(self):
+        """
+        All loans currently out, as (card_id, name, isbn, title, date_out,
+        due_date) tuples ordered by Card_id then ISBN.
+        """
+        with self.pool.reader() as conn:
+            return conn.execute(sql("active_loans")).fetchall()
@@ -0,0 +1,94 @@
+import sqlite3
+
+# Schema changes for existing library.db files. The database records the last
+# migration applied in PRAGMA user_version; each one runs once, in order, in
+# its own transaction.
+
+
+#secondary indexes behind the borrower, loan and fine lookups in LibraryDB
+def addSecondaryIndexes(conn):
+    # loans by borrower: pay_fines and the fine history report
+    conn.execute("""
+                 CREATE INDEX IF NOT EXISTS IDX_BOOK_LOANS_CARD_ID
+                 ON BOOK_LOANS(Card_id);""")
+
+    # active loans by borrower: check-in search by card and the active loan
+    # report, which reads them in (Card_id, Isbn) order straight off the index
+    conn.execute("""
+                 CREATE INDEX IF NOT EXISTS IDX_BOOK_LOANS_ACTIVE_CARD_ID
+                 ON BOOK_LOANS(Card_id, Isbn) WHERE Date_in IS NULL;""")
+
+    # every loan of a book, returned or not: BOOK deletes check it for foreign keys
+    conn.execute("""
+                 CREATE INDEX IF NOT EXISTS IDX_BOOK_LOANS_ISBN
+                 ON BOOK_LOANS(Isbn);""")
+
+    # borrowers who owe something, for the unpaid fines report
+    conn.execute("""
+                 CREATE INDEX IF NOT EXISTS IDX_BORROWER_ACCOUNT_OWING
+                 ON BORROWER_ACCOUNT(Card_id) WHERE Unpaid_fine_total > 0;""")
+
+
+#active loans in check-in order, so listing them all needs no sort
+def addActiveLoanOrderIndex(conn):
+    conn.execute("""
+                 CREATE INDEX IF NOT EXISTS IDX_BOOK_LOANS_ACTIVE_DATE_OUT
+                 ON BOOK_LOANS(Date_out, Loan_id) WHERE Date_in IS NULL;""")
+
+
+#per-trigram document counts of the search indexes, used to estimate how many
+#books a search matches before choosing how to page through them
+def addSearchVocabularies(conn):
+    conn.execute("""
+                 CREATE VIRTUAL TABLE IF NOT EXISTS BOOK_FTS_VOCAB
+                 USING fts5vocab(BOOK_FTS, 'row');""")
+    conn.execute("""
+                 CREATE VIRTUAL TABLE IF NOT EXISTS AUTHOR_FTS_VOCAB
+                 USING fts5vocab(AUTHOR_FTS, 'row');""")
+
+
+#the unique active-loan index answers every lookup the older active-Isbn
+#index was built for, so that one only cost checkouts and check-ins upkeep
+def dropActiveIsbnIndex(conn):
+    conn.execute("DROP INDEX IF EXISTS IDX_BOOK_LOANS_ACTIVE_ISBN;")
+
+
+# (version, description, function) in the order they are applied
+MIGRATIONS = [
+    (1, "secondary indexes on BOOK_LOANS and BORROWER_ACCOUNT", addSecondaryIndexes),
+    (2, "active loans ordered by Date_out", addActiveLoanOrderIndex),
+    (3, "trigram vocabularies of the search indexes", addSearchVocabularies),
+    (4, "drop the redundant active loan by Isbn index", dropActiveIsbnIndex),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schemaVersion(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+#bring the database up to LATEST_VERSION; returns the number of migrations applied
+def migrate(conn):
+    current = schemaVersion(conn)
+    if current > LATEST_VERSION:
+        print(f"WARNING: library.db is at schema version {current}, "
+              f"newer than this code ({LATEST_VERSION}).")
+        return 0
+
+    applied = 0
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.commit()
+        conn.execute("BEGIN;")
+        try:
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version};")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+        applied += 1
+    return applied
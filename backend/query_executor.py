@@ -0,0 +1,129 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from library_db import LibraryDB
+
+# How often (ms) the Tk thread checks for finished queries
+POLL_INTERVAL_MS = 30
+
+
+class QueryExecutor:
+    """
+    Runs LibraryDB work on background threads so the Tk main loop never
+    waits on SQLite.
+
+    The workers share one LibraryDB with a read-only connection each, so
+    searches keep running while another worker writes. Finished work is
+    queued and handed back on the Tk thread by a root.after() poll, so
+    callbacks can touch widgets safely.
+
+    Work submitted with a key supersedes earlier work with the same key
+    (e.g. a new search replaces the previous one): a still-running query
+    for that key is interrupted and its result is dropped.
+    """
+
+    def __init__(self, root, db_path, workers=2, on_busy_changed=None):
+        self.root = root
+        self.db_path = db_path
+        self.on_busy_changed = on_busy_changed
+
+        self.db = LibraryDB(db_path, readers=workers)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="library-db")
+        self.finished = queue.Queue()
+
+        # key -> generation of the newest submission, and the worker thread
+        # running it. A worker clears its entry under lock before it can take
+        # other work, so an interrupt sent under lock only hits that job
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.running = {}
+
+        # Only touched on the Tk thread
+        self.pending = 0
+        self.busy = False
+        self.poll_id = self.root.after(POLL_INTERVAL_MS, self.poll)
+
+    def submit(self, work, on_done=None, on_error=None, key=None):
+        """
+        Run work(db) on a worker thread with the shared LibraryDB.
+        on_done(result) or on_error(exception) is then called on the Tk thread.
+        """
+        generation = None
+        if key is not None:
+            with self.lock:
+                generation = self.latest.get(key, 0) + 1
+                self.latest[key] = generation
+                superseded = self.running.get(key)
+                if superseded is not None:
+                    self.db.pool.interrupt(superseded)
+
+        self.pending += 1
+        self.set_busy(True)
+
+        self.pool.submit(self.run, work, on_done, on_error, key, generation)
+
+    def set_busy(self, busy):
+        if busy != self.busy:
+            self.busy = busy
+            if self.on_busy_changed:
+                self.on_busy_changed(busy)
+
+    def is_current(self, key, generation):
+        if key is None:
+            return True
+        with self.lock:
+            return self.latest.get(key) == generation
+
+    def run(self, work, on_done, on_error, key, generation):
+        # Worker thread
+        if not self.is_current(key, generation):
+            self.finished.put((None, None, key, generation, None, None))
+            return
+
+        worker = threading.get_ident()
+        if key is not None:
+            with self.lock:
+                self.running[key] = worker
+
+        # LibraryDB rolls back its own failed writes
+        result = error = None
+        try:
+            result = work(self.db)
+        except Exception as exc:
+            error = exc
+        finally:
+            if key is not None:
+                with self.lock:
+                    if self.running.get(key) == worker:
+                        del self.running[key]
+
+        self.finished.put((on_done, on_error, key, generation, result, error))
+
+    def poll(self):
+        # Tk thread: deliver finished work, dropping superseded results.
+        # Reschedule first so a failing callback can't stop the polling.
+        self.poll_id = self.root.after(POLL_INTERVAL_MS, self.poll)
+
+        while True:
+            try:
+                on_done, on_error, key, generation, result, error = self.finished.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending -= 1
+            if not self.is_current(key, generation):
+                continue
+            if error is not None:
+                if on_error:
+                    on_error(error)
+            elif on_done:
+                on_done(result)
+
+        if self.pending == 0:
+            self.set_busy(False)
+
+    def shutdown(self):
+        # Call before root.destroy(); the poll can't be cancelled after it
+        self.root.after_cancel(self.poll_id)
+        self.pool.shutdown(wait=False, cancel_futures=True)
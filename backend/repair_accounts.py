@@ -0,0 +1,13 @@
+from init_db import DB_PATH
+from library_db import LibraryDB
+
+#recompute every borrower's active loan count and unpaid fine total
+def repairAccounts(dbPath=DB_PATH):
+    db = LibraryDB(dbPath)
+    try:
+        return db.repair_borrower_accounts()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    repairAccounts()
@@ -0,0 +1,336 @@
+from functools import lru_cache
+
+# Every SQL statement LibraryDB runs, by name.
+#
+# sqlite3 keeps prepared statements in a per-connection cache keyed by the
+# exact SQL text, so each entry here is prepared once per connection and
+# reused after that. Entries with {fields} are templates: sql() fills them
+# from the fragments below, and each distinct combination is built once.
+STATEMENTS = {
+    # ---------------------------------------------
+    # Borrowers
+    # ---------------------------------------------
+    "borrower_ssn_exists": """
+        SELECT 1 FROM BORROWER WHERE Ssn = ?
+    """,
+    "max_card_id": """
+        SELECT MAX(Card_id) FROM BORROWER
+    """,
+    "insert_borrower": """
+        INSERT INTO BORROWER (Card_id, Ssn, Bname, Address, Phone, Password)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "authenticate_borrower": """
+        SELECT Card_id, Bname FROM BORROWER WHERE Card_id = ? AND PASSWORD = ?
+    """,
+
+    # ---------------------------------------------
+    # Search
+    # ---------------------------------------------
+    "data_version": """
+        PRAGMA data_version
+    """,
+    # {matches} defines a MATCHES(Isbn) CTE and {matched} filters BOOK on
+    # it ("1" when every book matches), or tests each book itself. BOOK is
+    # read in ISBN order and MATCHES only probed, so a page needs no sort.
+    # CL is the book's current loan (the unique active-loan index allows at
+    # most one), so IN/OUT status needs no per-row EXISTS.
+    "search_books": """
+        {matches}
+        SELECT
+            B.Isbn,
+            B.Title,
+            (
+                SELECT GROUP_CONCAT(A.Name, char(31))
+                FROM BOOK_AUTHORS BA
+                JOIN AUTHORS A ON BA.Author_id = A.Author_id
+                WHERE BA.Isbn = B.Isbn
+            ) AS Authors,
+            CASE WHEN CL.Loan_id IS NULL THEN 'IN' ELSE 'OUT' END AS Status,
+            CL.Card_id AS Holder
+        FROM BOOK B
+        LEFT JOIN BOOK_LOANS CL ON CL.Loan_id = (
+            SELECT Loan_id FROM BOOK_LOANS
+            WHERE Isbn = B.Isbn AND Date_in IS NULL
+        )
+        WHERE {matched} AND B.Isbn > :after_key
+        ORDER BY B.Isbn
+        LIMIT :limit
+    """,
+    # Books in the catalog (MAX(rowid) stands in for COUNT(*), which reads
+    # every row), and for the trigrams of a query (a JSON array) the fewest
+    # books and authors any one of them occurs in: at most that many match
+    "search_match_estimate": """
+        SELECT
+            (SELECT COALESCE(MAX(rowid), 0) FROM BOOK),
+            MIN(COALESCE((SELECT doc FROM BOOK_FTS_VOCAB WHERE term = T.value), 0)),
+            MIN(COALESCE((SELECT doc FROM AUTHOR_FTS_VOCAB WHERE term = T.value), 0))
+        FROM json_each(:trigrams) T
+    """,
+
+    # ---------------------------------------------
+    # Checkout / check-in
+    # ---------------------------------------------
+    # Borrower account, book existence and availability in one query
+    "checkout_checks": """
+        SELECT
+            A.Active_loan_count,
+            A.Unpaid_fine_total,
+            EXISTS (SELECT 1 FROM BOOK WHERE Isbn = :isbn),
+            EXISTS (
+                SELECT 1 FROM BOOK_LOANS
+                WHERE Isbn = :isbn AND Date_in IS NULL
+            )
+        FROM (SELECT :card_id AS Card_id) R
+        LEFT JOIN BORROWER_ACCOUNT A ON A.Card_id = R.Card_id
+    """,
+    "insert_loan": """
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now'), DATE('now', '+14 days'), NULL)
+    """,
+    "checkin_loans": """
+        UPDATE BOOK_LOANS
+        SET Date_in = DATE('now')
+        WHERE Loan_id IN (SELECT value FROM json_each(?))
+          AND Date_in IS NULL
+    """,
+    "loans_for_checkin": """
+        SELECT
+            BL.Loan_id,
+            BL.Isbn,
+            B.Title,
+            BL.Card_id,
+            BR.Bname,
+            BL.Date_out,
+            BL.Due_date,
+            (
+                SELECT GROUP_CONCAT(A.Name, ', ')
+                FROM BOOK_AUTHORS BA
+                JOIN AUTHORS A ON BA.Author_id = A.Author_id
+                WHERE BA.Isbn = BL.Isbn
+            ) AS Authors
+        FROM BOOK_LOANS BL
+        JOIN BOOK B ON BL.Isbn = B.Isbn
+        JOIN BORROWER BR ON BL.Card_id = BR.Card_id
+        WHERE BL.Date_in IS NULL {loan_filter}
+        ORDER BY BL.Date_out, BL.Loan_id
+    """,
+
+    # ---------------------------------------------
+    # Fines
+    # ---------------------------------------------
+    "today": """
+        SELECT DATE('now')
+    """,
+    "max_loan_id": """
+        SELECT COALESCE(MAX(Loan_id), 0) FROM BOOK_LOANS
+    """,
+    "today_and_max_loan_id": """
+        SELECT DATE('now'), COALESCE(MAX(Loan_id), 0) FROM BOOK_LOANS
+    """,
+    "count_loans_through": """
+        SELECT COUNT(*) FROM BOOK_LOANS WHERE Loan_id <= ?
+    """,
+    "count_loans_between": """
+        SELECT COUNT(*) FROM BOOK_LOANS WHERE Loan_id > ? AND Loan_id <= ?
+    """,
+    "chunk_end_loan_id": """
+        SELECT Loan_id FROM BOOK_LOANS
+        WHERE Loan_id > ? AND Loan_id <= ?
+        ORDER BY Loan_id
+        LIMIT 1 OFFSET ?
+    """,
+    # Upsert fines for the late loans matching {loan_filter} (a condition on
+    # BOOK_LOANS). A returned loan is fined up to Date_in, a loan still out
+    # up to now.
+    "accrue_fines": """
+        INSERT INTO FINES (Loan_id, Fine_amt, Paid)
+        SELECT Loan_id, Fine, 0
+        FROM (
+            SELECT
+                Loan_id,
+                ROUND(
+                    CAST(
+                        julianday(COALESCE(Date_in, 'now')) - julianday(Due_date)
+                        AS INTEGER
+                    ) * 0.25,
+                    2
+                ) AS Fine
+            FROM BOOK_LOANS
+            WHERE ({loan_filter})
+              AND julianday(COALESCE(Date_in, 'now')) > julianday(Due_date)
+        )
+        WHERE Fine > 0
+        ON CONFLICT(Loan_id) DO UPDATE
+            SET Fine_amt = excluded.Fine_amt
+            WHERE FINES.Paid = 0
+              AND FINES.Fine_amt <> excluded.Fine_amt
+    """,
+    "get_meta": """
+        SELECT Value FROM LIBRARY_META WHERE Key = ?
+    """,
+    "set_meta": """
+        INSERT INTO LIBRARY_META (Key, Value) VALUES (?, ?)
+        ON CONFLICT(Key) DO UPDATE SET Value = excluded.Value
+    """,
+    "clear_fines_batch": """
+        DELETE FROM LIBRARY_META WHERE Key LIKE 'fines_batch_%'
+    """,
+    # Only returned loans' fines can be paid
+    "payable_fines_total": """
+        SELECT SUM(F.Fine_amt)
+        FROM FINES F
+        JOIN BOOK_LOANS BL ON F.Loan_id = BL.Loan_id
+        WHERE BL.Card_id = ?
+          AND F.Paid = 0
+          AND BL.Date_in IS NOT NULL
+    """,
+    "pay_fines": """
+        UPDATE FINES
+        SET Paid = 1
+        WHERE Loan_id IN (
+            SELECT BL.Loan_id
+            FROM BOOK_LOANS BL
+            JOIN FINES F ON F.Loan_id = BL.Loan_id
+            WHERE BL.Card_id = ?
+              AND F.Paid = 0
+              AND BL.Date_in IS NOT NULL
+        )
+    """,
+
+    # ---------------------------------------------
+    # Reports
+    # ---------------------------------------------
+    "fine_totals": """
+        SELECT B.Card_id, B.Bname, SUM(F.Fine_amt)
+        FROM BORROWER B
+        JOIN BOOK_LOANS BL ON BL.Card_id = B.Card_id
+        JOIN FINES F       ON F.Loan_id = BL.Loan_id
+        WHERE 1 {borrower_filter}
+        GROUP BY BL.Card_id
+        ORDER BY BL.Card_id
+    """,
+    # BORROWER_ACCOUNT already holds each borrower's unpaid total
+    "unpaid_fine_totals": """
+        SELECT B.Card_id, B.Bname, A.Unpaid_fine_total
+        FROM BORROWER_ACCOUNT A
+        JOIN BORROWER B ON B.Card_id = A.Card_id
+        WHERE A.Unpaid_fine_total > 0 {borrower_filter}
+        ORDER BY A.Card_id
+    """,
+    "active_loans": """
+        SELECT BL.Card_id,
+               BR.Bname,
+               BL.Isbn,
+               B.Title,
+               BL.Date_out,
+               BL.Due_date
+        FROM BOOK_LOANS BL
+        JOIN BORROWER BR ON BL.Card_id = BR.Card_id
+        JOIN BOOK     B  ON BL.Isbn    = B.Isbn
+        WHERE BL.Date_in IS NULL
+        ORDER BY BL.Card_id, BL.Isbn
+    """,
+}
+
+# Pieces the templates above are filled from
+FRAGMENTS = {
+    "nothing": "",
+
+    # search_books
+    "all_books": "1",
+    "matched_books": "B.Isbn IN (SELECT Isbn FROM MATCHES)",
+    # Substring matches resolved through the trigram indexes
+    "trigram_book_matches": """
+        WITH MATCHES(Isbn) AS (
+            SELECT Isbn FROM BOOK_FTS WHERE Isbn LIKE :search
+            UNION
+            SELECT Isbn FROM BOOK_FTS WHERE Title LIKE :search
+            UNION
+            SELECT BA.Isbn
+            FROM AUTHOR_FTS AF
+            JOIN BOOK_AUTHORS BA ON BA.Author_id = AF.rowid
+            WHERE AF.Name LIKE :search
+        )
+    """,
+    # Substring test of each book, for pages of a broad query: reading BOOK in
+    # ISBN order stops as soon as the page is full, where building MATCHES
+    # would first find every matching book
+    "tested_books": """
+        (
+            LOWER(B.Isbn) LIKE :search
+            OR LOWER(B.Title) LIKE :search
+            OR EXISTS (
+                SELECT 1
+                FROM BOOK_AUTHORS BA
+                JOIN AUTHORS A ON A.Author_id = BA.Author_id
+                WHERE BA.Isbn = B.Isbn AND LOWER(A.Name) LIKE :search
+            )
+        )
+    """,
+    # Substring scan, for queries the trigram index can't answer
+    "scan_book_matches": """
+        WITH MATCHES(Isbn) AS (
+            SELECT Isbn FROM BOOK
+            WHERE LOWER(Isbn) LIKE :search OR LOWER(Title) LIKE :search
+            UNION
+            SELECT BA.Isbn
+            FROM AUTHORS A
+            JOIN BOOK_AUTHORS BA ON BA.Author_id = A.Author_id
+            WHERE LOWER(A.Name) LIKE :search
+        )
+    """,
+
+    # loans_for_checkin
+    "trigram_loan_filter": """
+        AND (
+            BL.Isbn IN (SELECT Isbn FROM BOOK_FTS WHERE Isbn LIKE :search)
+            OR BL.Card_id IN (
+                SELECT Card_id FROM BORROWER_FTS WHERE Card_id LIKE :search
+                UNION
+                SELECT Card_id FROM BORROWER_FTS WHERE Bname LIKE :search
+            )
+        )
+    """,
+    "scan_loan_filter": """
+        AND (
+            LOWER(B.Isbn)   LIKE :search
+            OR LOWER(BL.Card_id) LIKE :search
+            OR LOWER(BR.Bname)   LIKE :search
+        )
+    """,
+
+    # fine_totals / unpaid_fine_totals
+    "trigram_borrower_filter": """
+        AND B.Card_id IN (
+            SELECT Card_id FROM BORROWER_FTS WHERE Card_id LIKE :search
+            UNION
+            SELECT Card_id FROM BORROWER_FTS WHERE Bname LIKE :search
+        )
+    """,
+    "scan_borrower_filter": """
+        AND (LOWER(B.Card_id) LIKE :search OR LOWER(B.Bname) LIKE :search)
+    """,
+
+    # accrue_fines
+    "every_loan": "1",
+    # the ids as one JSON array parameter, so any number share one statement
+    "loan_ids": "Loan_id IN (SELECT value FROM json_each(?))",
+    "loans_after_or_returned_since": "Loan_id > ? OR Date_in >= ?",
+    "loans_still_out": "Date_in IS NULL",
+    "loan_id_range": "Loan_id > ? AND Loan_id <= ?",
+}
+
+
+@lru_cache(maxsize=None)
+def sql(name, **fields):
+    """
+    The text of statement name, with each template field filled from the
+    fragment named for it (e.g. loan_filter="loans_still_out").
+    """
+    text = STATEMENTS[name]
+    if fields:
+        text = text.format(**{
+            field: FRAGMENTS[fragment] for field, fragment in fields.items()
+        })
+    return text
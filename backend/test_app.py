@@ -1,17 +1,30 @@
 from pathlib import Path
-from init_db import initDb, DB_PATH
+from init_db import initDb, syncCatalog, createTables, createIndexes, DB_PATH, DATA_DIR
+from migrations import migrate, schemaVersion, LATEST_VERSION
 from library_db import LibraryDB
+from statements import sql
+from async_library_db import AsyncLibraryDB
+import asyncio
+import contextlib
+import csv
 import datetime
+import io
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 
 # ===========================
 # Helpers
 # ===========================
 
 def reset_loans_and_fines(db: LibraryDB):
-    """Clear BOOK_LOANS and FINES so each checkout/fine test starts clean."""
+    """Clear BOOK_LOANS, FINES and the fine accrual markers so each checkout/fine test starts clean."""
     cur = db.cur
     cur.execute("DELETE FROM FINES;")
     cur.execute("DELETE FROM BOOK_LOANS;")
+    cur.execute("DELETE FROM LIBRARY_META WHERE Key LIKE 'fines%';")
     db.conn.commit()
 
 
@@ -83,6 +96,126 @@ def test_search_case_insensitive(db: LibraryDB):
     results = db.search_books(query_lower)
     print(f"Results count = {len(results)}")
 
+
+def test_search_author_substring(db: LibraryDB):
+    """
+    A substring from the middle of an author name (e.g. "ark" in "Mark")
+    should still find the book through the trigram index.
+    """
+    print("\n[SEARCH TEST] Substring search inside an author name")
+
+    cur = db.cur
+    cur.execute("""
+        SELECT BA.Isbn, A.Name
+        FROM BOOK_AUTHORS BA
+        JOIN AUTHORS A ON BA.Author_id = A.Author_id
+        WHERE LENGTH(A.Name) >= 6
+        LIMIT 1;
+    """)
+    row = cur.fetchone()
+    if row is None:
+        print("No authors in AUTHORS table – cannot run substring test.")
+        return
+
+    isbn, name = row
+    query = name[1:5].upper()
+
+    print(f"Using author={name!r}, query={query!r}")
+    results = db.search_books(query)
+    found = any(book["isbn"] == isbn for book in results)
+    print(f"Results count = {len(results)}, expected ISBN found (should be True): {found}")
+
+
+def test_search_status_out(db: LibraryDB):
+    """A book with an active loan should be reported OUT, and IN again once returned."""
+    print("\n[SEARCH TEST] IN/OUT status follows active loans")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    isbn = isbns[0]
+    cur = db.cur
+
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-1 day'), DATE('now', '+13 days'), NULL)
+    """, (isbn, card_id))
+    loan_id = cur.lastrowid
+    db.conn.commit()
+
+    status = [b["status"] for b in db.search_books(isbn) if b["isbn"] == isbn]
+    print("  Status while on loan (should be ['OUT']):", status)
+
+    holder = [b["holder"] for b in db.search_books(isbn, include_holder=True) if b["isbn"] == isbn]
+    print(f"  Holder while on loan (should be [{card_id!r}]):", holder)
+
+    cur.execute("UPDATE BOOK_LOANS SET Date_in = DATE('now') WHERE Loan_id = ?", (loan_id,))
+    db.conn.commit()
+
+    status = [b["status"] for b in db.search_books(isbn) if b["isbn"] == isbn]
+    print("  Status after return (should be ['IN']):", status)
+    reset_loans_and_fines(db)
+
+
+def test_search_pagination(db: LibraryDB):
+    """Keyset pages and the streaming generator should return the same rows as one full search."""
+    print("\n[SEARCH TEST] Keyset pagination matches the full result")
+
+    # a broad query, one too short for the trigram index and a narrow one
+    for query in ["the", "an", "tolkien"]:
+        full = [book["isbn"] for book in db.search_books(query)]
+
+        # pages must come from the database, not the cached full result
+        db.clear_search_cache()
+        paged = []
+        after_key = None
+        while True:
+            page = db.search_books(query, limit=100, after_key=after_key)
+            paged.extend(book["isbn"] for book in page)
+            if len(page) < 100:
+                break
+            after_key = page[-1]["isbn"]
+
+        db.clear_search_cache()
+        streamed = [book["isbn"] for book in db.iter_search_books(query, page_size=250)]
+
+        print(f"Full results for {query!r} = {len(full)}")
+        print("  Paged results match (should be True):", paged == full)
+        print("  Streamed results match (should be True):", streamed == full)
+
+
+def test_search_cache(db: LibraryDB):
+    """Cached and prefix-extended searches match fresh ones, and checkout refreshes status."""
+    print("\n[SEARCH TEST] Result cache and invalidation")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    isbn = isbns[0]
+
+    first = db.search_books("tolk")
+    again = db.search_books("tolk")
+    extended = db.search_books("tolkien")
+    db.clear_search_cache()
+    fresh = db.search_books("tolkien")
+    print("  Repeated search matches (should be True):", first == again)
+    print("  Prefix-extended search matches a fresh one (should be True):", extended == fresh)
+
+    # A page cached for the query "complete" must not pass for a complete result
+    db.search_books("complete", limit=200)
+    try:
+        after_complete = db.search_books("shakespeare", limit=200)
+        db.clear_search_cache()
+        print("  Search after a \"complete\" query matches a fresh one (should be True):",
+              after_complete == db.search_books("shakespeare", limit=200))
+    except TypeError as exc:
+        print("  Search after a \"complete\" query (should be True): TypeError", exc)
+
+    before = [b["status"] for b in db.search_books(isbn) if b["isbn"] == isbn]
+    db.checkout_book(isbn, card_id)
+    after = [b["status"] for b in db.search_books(isbn) if b["isbn"] == isbn]
+    print("  Status before/after checkout (should be ['IN'] ['OUT']):", before, after)
+    reset_loans_and_fines(db)
+
+
 # ===========================
 # create_borrower TESTS
 # ===========================
@@ -133,7 +266,7 @@ def test_create_borrower_success_and_duplicate(db: LibraryDB):
 # ===========================
 
 def test_checkout_nonexistent_borrower(db: LibraryDB):
-    print("\n[CHECKOUT TEST] Nonexistent borrower → expect False")
+    print("\n[CHECKOUT TEST] Nonexistent borrower → expect BORROWER_NOT_FOUND")
     reset_loans_and_fines(db)
     (isbns, _card, _ssn) = get_sample_book_and_borrower(db)
     isbn = isbns[0]
@@ -144,7 +277,7 @@ def test_checkout_nonexistent_borrower(db: LibraryDB):
 
 
 def test_checkout_unpaid_fines(db: LibraryDB):
-    print("\n[CHECKOUT TEST] Borrower has unpaid fines → expect False")
+    print("\n[CHECKOUT TEST] Borrower has unpaid fines → expect FINES_DUE")
     reset_loans_and_fines(db)
     (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
     isbn = isbns[0]
@@ -177,7 +310,7 @@ def test_checkout_unpaid_fines(db: LibraryDB):
 
 
 def test_checkout_max_loans(db: LibraryDB):
-    print("\n[CHECKOUT TEST] Borrower already has 3 active loans → expect False")
+    print("\n[CHECKOUT TEST] Borrower already has 3 active loans → expect MAX_LOANS")
     reset_loans_and_fines(db)
     (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
 
@@ -204,7 +337,7 @@ def test_checkout_max_loans(db: LibraryDB):
 
 
 def test_checkout_nonexistent_book(db: LibraryDB):
-    print("\n[CHECKOUT TEST] Nonexistent book → expect False")
+    print("\n[CHECKOUT TEST] Nonexistent book → expect BOOK_NOT_FOUND")
     reset_loans_and_fines(db)
     (_isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
 
@@ -214,21 +347,268 @@ def test_checkout_nonexistent_book(db: LibraryDB):
 
 
 def test_checkout_book_already_out(db: LibraryDB):
-    print("\n[CHECKOUT TEST] Book already checked out → expect False on 2nd checkout")
+    print("\n[CHECKOUT TEST] Book already checked out → expect ALREADY_OUT on 2nd checkout")
     reset_loans_and_fines(db)
     (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
     isbn = isbns[0]
 
     # First checkout should succeed (happy-path success)
-    print("  First checkout (should be True):")
+    print("  First checkout (should be OK):")
     first = db.checkout_book(isbn, card_id)
     print("  Result:", first)
 
     # Second checkout of the same book should fail
-    print("  Second checkout of same book (should be False):")
+    print("  Second checkout of same book (should be ALREADY_OUT):")
     second = db.checkout_book(isbn, card_id)
     print("  Result:", second)
 
+def test_checkout_books_cart(db: LibraryDB):
+    print("\n[CHECKOUT TEST] checkout_books cart → per-item results, 3-loan limit across the cart")
+    reset_loans_and_fines(db)
+    (_isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    cur.execute("SELECT Isbn FROM BOOK LIMIT 4;")
+    isbns = [r[0] for r in cur.fetchall()]
+
+    # The first book twice, then three more: only three loans are allowed
+    cart = [(card_id, isbns[0]), (card_id, isbns[0])] + [(card_id, isbn) for isbn in isbns[1:]]
+    results = db.checkout_books(cart)
+    print("  Results (should be OK, ALREADY_OUT, OK, OK, MAX_LOANS):",
+          ", ".join(r.name for r in results))
+
+    cur.execute("SELECT Isbn FROM BOOK_LOANS WHERE Card_id = ? AND Date_in IS NULL ORDER BY Loan_id", (card_id,))
+    print("  Active loans (should be the first three ISBNs):", [r[0] for r in cur.fetchall()] == isbns[:3])
+
+
+def test_checkout_concurrent_stations(db: LibraryDB):
+    print("\n[CHECKOUT TEST] Two stations check out the same book at once → exactly one OK")
+    reset_loans_and_fines(db)
+    cur = db.cur
+
+    rounds = 10
+    cur.execute("SELECT Isbn FROM BOOK LIMIT ?;", (rounds,))
+    isbns = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT Card_id FROM BORROWER LIMIT 2;")
+    cards = [r[0] for r in cur.fetchall()]
+
+    start = threading.Barrier(len(cards))
+    results = {card_id: [] for card_id in cards}
+
+    def station(card_id):
+        # each station has its own connection, like a second copy of the GUI
+        station_db = LibraryDB(DB_PATH)
+        for isbn in isbns:
+            start.wait()
+            results[card_id].append(station_db.checkout_book(isbn, card_id))
+            start.wait()
+            # hand the book back so loan limits don't interfere
+            station_db.cur.execute(
+                "UPDATE BOOK_LOANS SET Date_in = DATE('now') WHERE Card_id = ? AND Date_in IS NULL",
+                (card_id,),
+            )
+            station_db.conn.commit()
+        station_db.close()
+
+    threads = [threading.Thread(target=station, args=(card_id,)) for card_id in cards]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    winners = [sum(bool(results[c][i]) for c in cards) for i in range(len(isbns))]
+    print(f"  OKs per book over {len(isbns)} races (should all be 1):", winners)
+
+    try:
+        cur.execute("""
+            INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+            VALUES (?, ?, DATE('now'), DATE('now', '+14 days'), NULL), (?, ?, DATE('now'), DATE('now', '+14 days'), NULL)
+        """, (isbns[0], cards[0], isbns[0], cards[1]))
+        print("  Duplicate active loan insert (should be rejected): accepted")
+    except sqlite3.IntegrityError:
+        print("  Duplicate active loan insert (should be rejected): rejected")
+    db.conn.rollback()
+
+
+def test_search_during_write(db: LibraryDB):
+    print("\n[POOL TEST] Searches keep running while another thread holds the writer")
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+
+    shared = LibraryDB(DB_PATH, readers=2)
+    writing = threading.Event()
+    release = threading.Event()
+
+    def long_write():
+        # a checkout left uncommitted, like update_fines part way through
+        with shared._write_transaction():
+            shared.cur.execute(
+                "INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in) "
+                "VALUES (?, ?, DATE('now'), DATE('now', '+14 days'), NULL)",
+                (isbns[0], card_id),
+            )
+            writing.set()
+            release.wait(10)
+
+    writer = threading.Thread(target=long_write)
+    writer.start()
+    writing.wait(10)
+
+    results = []
+    reader = threading.Thread(target=lambda: results.append(shared.search_books(isbns[0], include_holder=True)))
+    reader.start()
+    reader.join(5)
+    print("  Search finished while the write was open (should be True):", not reader.is_alive())
+    print("  Search sees the last committed status (should be ['IN']):",
+          [b["status"] for b in results[0]] if results else None)
+
+    release.set()
+    writer.join()
+    after = shared.search_books(isbns[0], include_holder=True)
+    print("  Status once the write commits (should be ['OUT']):", [b["status"] for b in after])
+    shared.close()
+    reset_loans_and_fines(db)
+
+
+def test_read_inside_write(db: LibraryDB):
+    print("\n[POOL TEST] A read inside a write hands the thread back to the writer")
+    shared = LibraryDB(DB_PATH, readers=1)
+    pool = shared.pool
+    thread_id = threading.get_ident()
+
+    try:
+        with pool.writer() as writer_conn:
+            with pool.reader() as reader_conn:
+                print("  Thread uses the reader inside it (should be True):", pool.in_use.get(thread_id) is reader_conn)
+            print("  Thread uses the writer again (should be True):", pool.in_use.get(thread_id) is writer_conn)
+        print("  Writer released cleanly (should be True):", thread_id not in pool.in_use)
+    except KeyError:
+        print("  Writer released cleanly (should be True): KeyError")
+    shared.close()
+
+
+def test_async_lanes(db: LibraryDB):
+    print("\n[ASYNC TEST] Slow reports don't hold up checkouts; calls time out and free their slot")
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+
+    def slow_report(library):
+        time.sleep(1)
+
+    def runaway_query(library):
+        with library.pool.reader() as conn:
+            conn.execute(
+                "WITH RECURSIVE N(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM N) "
+                "SELECT COUNT(*) FROM N"
+            ).fetchone()
+
+    async def scenario():
+        async with AsyncLibraryDB(DB_PATH, read_workers=1, max_pending_reads=2) as library:
+            reports = [asyncio.create_task(library._call(library.reads, 5, slow_report)) for _ in range(2)]
+            await asyncio.sleep(0.1)
+
+            started = time.monotonic()
+            checkout = await library.checkout_book(isbns[0], card_id)
+            print("  Checkout OK while the read lane is full (should be True):", bool(checkout))
+            print("  Checkout didn't wait for the reports (should be True):", time.monotonic() - started < 0.5)
+
+            try:
+                await library.search_books(isbns[0], timeout=0.2)
+                print("  Search beyond the read lane's limit (should be TimeoutError): returned")
+            except asyncio.TimeoutError:
+                print("  Search beyond the read lane's limit (should be TimeoutError): TimeoutError")
+            await asyncio.gather(*reports)
+
+            try:
+                await library._call(library.reads, 0.2, runaway_query)
+                print("  Runaway query (should be TimeoutError): returned")
+            except asyncio.TimeoutError:
+                print("  Runaway query (should be TimeoutError): TimeoutError")
+            started = time.monotonic()
+            books = await library.search_books(isbns[0], include_holder=True, timeout=2)
+            print("  Search after the interrupt sees the checkout (should be ['OUT']):", [b["status"] for b in books])
+            print("  Interrupted query freed its reader (should be True):", time.monotonic() - started < 1)
+
+            loans = await library.find_loans_for_checkin(card_id)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                checked_in = await library.checkin_loans([loans[0]["loan_id"]])
+            print("  Loans checked in through the facade (should be 1):", checked_in)
+            print("  Messages printed by the facade (should be ''):", repr(output.getvalue()))
+
+            # A write that times out between statements, where an interrupt
+            # has nothing to stop, must not commit afterwards
+            def slow_checkout(library):
+                with library._write_transaction():
+                    library.cur.execute(
+                        "INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in) "
+                        "VALUES (?, ?, DATE('now'), DATE('now', '+14 days'), NULL)",
+                        (isbns[1], card_id),
+                    )
+                    time.sleep(0.5)
+
+            try:
+                await library._call(library.writes, 0.2, slow_checkout)
+                print("  Slow write (should be TimeoutError): returned")
+            except asyncio.TimeoutError:
+                print("  Slow write (should be TimeoutError): TimeoutError")
+            # let the write run to its end first
+            await asyncio.sleep(0.5)
+            books = await library.search_books(isbns[1], timeout=2)
+            print("  Timed-out write left the book (should be ['IN']):", [b["status"] for b in books])
+
+        # A caller that gives up while waiting for a slot must not keep it
+        async with AsyncLibraryDB(DB_PATH, read_workers=1, max_pending_reads=1) as library:
+            blocker = asyncio.create_task(library._call(library.reads, 5, slow_report))
+            await asyncio.sleep(0.1)
+            waiter = asyncio.create_task(library.list_active_loans())
+            await asyncio.sleep(0.1)
+            waiter.cancel()
+            await asyncio.gather(blocker, waiter, return_exceptions=True)
+            books = await library.search_books(isbns[0], timeout=1)
+            print("  Read lane usable after a cancelled waiter (should be 1):", len(books))
+
+    asyncio.run(scenario())
+    reset_loans_and_fines(db)
+
+
+def test_borrower_account_summary(db: LibraryDB):
+    print("\n[ACCOUNT TEST] BORROWER_ACCOUNT follows checkout, fines, payment and check-in")
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    def account():
+        cur.execute("""
+            SELECT Active_loan_count, Unpaid_fine_total
+            FROM BORROWER_ACCOUNT WHERE Card_id = ?
+        """, (card_id,))
+        return cur.fetchone()
+
+    db.checkout_book(isbns[0], card_id)
+    print("  After checkout (should be (1, 0.0)):", account())
+
+    # A late loan returned long ago, then fined
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, '2025-01-01', '2025-01-10', '2025-01-14')
+    """, (isbns[1 % len(isbns)], card_id))
+    db.conn.commit()
+    db.update_fines()
+    print("  After update_fines (should be (1, 1.0)):", account())
+
+    db.pay_fines(card_id)
+    print("  After pay_fines (should be (1, 0.0)):", account())
+
+    db.checkin_book(isbns[0], [1])
+    print("  After check-in (should be (0, 0.0)):", account())
+
+    # Damage the summary and let the repair command put it back
+    cur.execute("UPDATE BORROWER_ACCOUNT SET Active_loan_count = 5 WHERE Card_id = ?", (card_id,))
+    db.conn.commit()
+    fixed = db.repair_borrower_accounts()
+    print("  Rows repaired (should be 1):", fixed, "account:", account())
+
 # ===========================
 # checkin_book TESTS (query + selections) – SUCCESS CASES
 # ===========================
@@ -275,15 +655,14 @@ def test_checkin_book_by_isbn(db: LibraryDB):
 
     isbn = isbns[0]
 
-    # Create 2 active loans for this borrower, same ISBN
-    for _ in range(2):
-        cur.execute("""
-            INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
-            VALUES (?, ?, DATE('now', '-5 days'), DATE('now', '+9 days'), NULL)
-        """, (isbn, card_id))
+    # Create an active loan for this ISBN (a book can only be out once)
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-5 days'), DATE('now', '+9 days'), NULL)
+    """, (isbn, card_id))
     db.conn.commit()
 
-    # Confirm these loans exist and capture their IDs for verification
+    # Confirm the loan exists and capture its ID for verification
     cur.execute("""
         SELECT Loan_id
         FROM BOOK_LOANS
@@ -293,11 +672,11 @@ def test_checkin_book_by_isbn(db: LibraryDB):
     loan_ids_before = [row[0] for row in cur.fetchall()]
     print("  Loan_ids before check-in (ISBN match):", loan_ids_before)
 
-    # Use ISBN as the search query; both loans should appear in results
-    result = db.checkin_book(isbn, [1, 2])
+    # Use ISBN as the search query; the loan should appear in results
+    result = db.checkin_book(isbn, [1])
     print("  Result of ISBN-based check-in (should be True):", result)
 
-    # Verify both of those specific Loan_ids are now checked in
+    # Verify that specific Loan_id is now checked in
     cur.execute("""
         SELECT Loan_id, Date_in
         FROM BOOK_LOANS
@@ -369,6 +748,62 @@ def test_checkin_book_by_borrower_name(db: LibraryDB):
     else:
         print("  No loans found to verify after name-based check-in.")
 
+def test_checkin_loans_by_id(db: LibraryDB):
+    print("\n[CHECKIN TEST] checkin_loans by Loan_id with fines for those loans")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    # One loan 4 days overdue, one not yet due
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-18 days'), DATE('now', '-4 days'), NULL)
+    """, (isbns[0], card_id))
+    late_loan = cur.lastrowid
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-1 days'), DATE('now', '+13 days'), NULL)
+    """, (isbns[1 % len(isbns)], card_id))
+    ok_loan = cur.lastrowid
+    db.conn.commit()
+
+    checked_in = db.checkin_loans([late_loan, ok_loan])
+    print("  Loans checked in (should be 2):", checked_in)
+
+    cur.execute("SELECT Loan_id, Fine_amt FROM FINES ORDER BY Loan_id")
+    print("  FINES rows (should only be the late loan at 1.0):", cur.fetchall() == [(late_loan, 1.0)])
+
+    again = db.checkin_loans([late_loan])
+    print("  Checking in the same loan again (should be 0):", again)
+
+
+def test_find_loans_for_checkin_authors(db: LibraryDB):
+    print("\n[CHECKIN TEST] find_loans_for_checkin returns authors with each loan")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-1 day'), DATE('now', '+13 days'), NULL)
+    """, (isbns[0], card_id))
+    db.conn.commit()
+
+    cur.execute("""
+        SELECT GROUP_CONCAT(A.Name, ', ')
+        FROM BOOK_AUTHORS BA
+        JOIN AUTHORS A ON BA.Author_id = A.Author_id
+        WHERE BA.Isbn = ?
+    """, (isbns[0],))
+    expected = cur.fetchone()[0] or ""
+
+    loans = db.find_loans_for_checkin(card_id)
+    authors = [loan["authors"] for loan in loans]
+    print(f"  Authors (should be [{expected!r}]):", authors)
+    reset_loans_and_fines(db)
+
 # ===========================
 # checkin_book TESTS – FAILURE PATHS
 # ===========================
@@ -561,6 +996,91 @@ def test_update_fines_respects_paid_and_updates_unpaid(db: LibraryDB):
     cur.execute("SELECT Fine_amt, Paid FROM FINES WHERE Loan_id = ?", (loan_id,))
     print("  After update_fines, unpaid fine row (should be updated to correct amount):", cur.fetchone())
 
+def test_update_fines_incremental(db: LibraryDB):
+    print("\n[FINES TEST] incremental update_fines only recalculates changed loans")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    # Returned 4 days late -> 1.00, accrued by a full run
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, '2025-01-01', '2025-01-10', '2025-01-14')
+    """, (isbns[0], card_id))
+    old_loan = cur.lastrowid
+    db.conn.commit()
+    db.update_fines()
+
+    # Tamper with the old fine; an incremental run must not look at it again
+    cur.execute("UPDATE FINES SET Fine_amt = 9.99 WHERE Loan_id = ?", (old_loan,))
+
+    # New loan returned 2 days late -> 0.50, must be picked up
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, '2025-02-01', '2025-02-10', '2025-02-12')
+    """, (isbns[1 % len(isbns)], card_id))
+    new_loan = cur.lastrowid
+    db.conn.commit()
+
+    db.update_fines(incremental=True)
+    cur.execute("SELECT Fine_amt FROM FINES WHERE Loan_id = ?", (old_loan,))
+    print("  Old loan fine (should stay 9.99):", cur.fetchone())
+    cur.execute("SELECT Fine_amt FROM FINES WHERE Loan_id = ?", (new_loan,))
+    print("  New loan fine (should be 0.5):", cur.fetchone())
+
+    # Check-in recalculates just the loan it closes
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-20 days'), DATE('now', '-6 days'), NULL)
+    """, (isbns[2 % len(isbns)], card_id))
+    late_loan = cur.lastrowid
+    db.conn.commit()
+
+    db.checkin_book(card_id, [1])
+    cur.execute("SELECT Fine_amt FROM FINES WHERE Loan_id = ?", (late_loan,))
+    print("  Checked-in late loan fine (should be 1.5):", cur.fetchone())
+    cur.execute("SELECT Fine_amt FROM FINES WHERE Loan_id = ?", (old_loan,))
+    print("  Old loan fine after check-in (should stay 9.99):", cur.fetchone())
+
+    # Any number of loan_ids share one statement, past SQLite's variable limit too
+    statements = sql.cache_info().currsize
+    db.update_fines(loan_ids=[late_loan])
+    db.update_fines(loan_ids=[late_loan, *range(-40000, 0)])
+    print("  Statements built for long loan_ids lists (should be 0):", sql.cache_info().currsize - statements)
+    cur.execute("SELECT Fine_amt FROM FINES WHERE Loan_id = ?", (late_loan,))
+    print("  Fine after loan_ids runs (should be 1.5):", cur.fetchone())
+
+def test_iter_accrue_fines_resumes(db: LibraryDB):
+    print("\n[FINES TEST] batch accrual commits per chunk and resumes after interruption")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    # Three loans returned 1, 2 and 3 days late
+    for days_late in (1, 2, 3):
+        cur.execute("""
+            INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+            VALUES (?, ?, '2025-01-01', '2025-01-10', DATE('2025-01-10', ?))
+        """, (isbns[0], card_id, f"+{days_late} days"))
+    db.conn.commit()
+
+    # Stop after the first chunk, as if the job was killed
+    progress = []
+    for step in db.iter_accrue_fines(chunk_size=1):
+        progress.append(step)
+        if len(progress) == 2:
+            break
+    print("  First run progress (should be [(0, 3), (1, 3)]):", progress)
+    cur.execute("SELECT COUNT(*) FROM FINES")
+    print("  Fines after interruption (should be 1):", cur.fetchone()[0])
+
+    progress = list(db.iter_accrue_fines(chunk_size=1))
+    print("  Resumed run progress (should be [(1, 3), (2, 3), (3, 3)]):", progress)
+    cur.execute("SELECT Fine_amt FROM FINES ORDER BY Loan_id")
+    print("  Fines after resume (should be 0.25, 0.5, 0.75):", [r[0] for r in cur.fetchall()])
+
 # ===========================
 # pay_fines TESTS
 # ===========================
@@ -617,6 +1137,162 @@ def test_pay_fines_no_fines(db: LibraryDB):
     total_paid = db.pay_fines(card_id)
     print("  Total paid (should be 0.0):", total_paid)
 
+# ===========================
+# report TESTS
+# ===========================
+
+def test_search_fines_and_active_loans(db: LibraryDB):
+    print("\n[REPORT TEST] search_fines and list_active_loans")
+
+    reset_loans_and_fines(db)
+    (isbns, card_id, _ssn) = get_sample_book_and_borrower(db)
+    cur = db.cur
+
+    # One returned loan with a paid fine, one active loan with an unpaid fine
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, '2025-01-01', '2025-01-10', '2025-01-20')
+    """, (isbns[0], card_id))
+    cur.execute("INSERT INTO FINES (Loan_id, Fine_amt, Paid) VALUES (?, 2.50, 1)", (cur.lastrowid,))
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        VALUES (?, ?, DATE('now', '-15 days'), DATE('now', '-1 day'), NULL)
+    """, (isbns[1], card_id))
+    cur.execute("INSERT INTO FINES (Loan_id, Fine_amt, Paid) VALUES (?, 0.25, 0)", (cur.lastrowid,))
+    db.conn.commit()
+
+    print(f"  Unpaid only (should be [({card_id!r}, ..., 0.25)]):", db.search_fines(card_id.lower()))
+    print("  Including paid (total should be 2.75):", db.search_fines(card_id, include_paid=True))
+
+    loans = db.list_active_loans()
+    print(f"  Active loans (should be 1 row for {isbns[1]}):", loans)
+    reset_loans_and_fines(db)
+
+# ===========================
+# catalog sync TESTS
+# ===========================
+
+def test_sync_catalog_delta(db: LibraryDB):
+    print("\n[SYNC TEST] syncCatalog applies a changed book.csv and skips unchanged files")
+    reset_loans_and_fines(db)
+    cur = db.cur
+
+    cur.execute("SELECT Isbn, Title FROM BOOK ORDER BY Isbn LIMIT 3;")
+    (renamed, _old_title), (dropped, _), (lent, _) = cur.fetchall()
+
+    # A loan keeps its book in the catalog even when the file drops it
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+        SELECT ?, Card_id, '2025-01-01', '2025-01-15', '2025-01-10' FROM BORROWER LIMIT 1
+    """, (lent,))
+    db.conn.commit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(tmp)
+        for name in ("authors.csv", "book_authors.csv"):
+            shutil.copy(DATA_DIR / name, data / name)
+
+        with (DATA_DIR / "book.csv").open(encoding="utf-8", newline="") as src, \
+                (data / "book.csv").open("w", encoding="utf-8", newline="") as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            writer.writerow(next(reader))
+            for isbn, title in reader:
+                if isbn == renamed:
+                    title = "Renamed In Sync Test"
+                if isbn not in (dropped, lent):
+                    writer.writerow([isbn, title])
+            writer.writerow(["SYNCTEST01", "Added In Sync Test"])
+
+        syncCatalog(db.conn, data)
+
+    cur.execute("SELECT Title FROM BOOK WHERE Isbn = ?", (renamed,))
+    print("  Renamed title (should be 'Renamed In Sync Test'):", cur.fetchone()[0])
+    cur.execute("SELECT COUNT(*) FROM BOOK WHERE Isbn IN (?, ?, 'SYNCTEST01')", (dropped, lent))
+    print("  Books left of dropped/lent/added (should be 2):", cur.fetchone()[0])
+    results = db.search_books("Added In Sync")
+    print("  Search finds the added book (should be ['SYNCTEST01']):", [b["isbn"] for b in results])
+
+    # Syncing back to the bundled files restores the catalog
+    syncCatalog(db.conn)
+    cur.execute("SELECT COUNT(*) FROM BOOK WHERE Isbn IN (?, 'SYNCTEST01')", (dropped,))
+    print("  After syncing back, dropped restored and added removed (should be 1):", cur.fetchone()[0])
+    cur.execute("SELECT COUNT(*) FROM BOOK_AUTHORS WHERE Isbn = ?", (dropped,))
+    print("  Dropped book's authors restored (should be > 0):", cur.fetchone()[0])
+    reset_loans_and_fines(db)
+
+def test_init_db_interrupted_load():
+    print("\n[INIT TEST] A failed first load leaves no half-built library.db behind")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(tmp) / "data"
+        data.mkdir()
+        # borrower.csv is loaded last; without it the load fails part way
+        for name in ("book.csv", "authors.csv", "book_authors.csv"):
+            shutil.copy(DATA_DIR / name, data / name)
+
+        db_path = Path(tmp) / "library.db"
+        try:
+            initDb(db_path, data)
+            print("  Load without borrower.csv (should fail): succeeded")
+        except FileNotFoundError:
+            print("  Load without borrower.csv (should fail): failed")
+
+        conn = sqlite3.connect(db_path)
+        tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table';").fetchone()[0]
+        conn.close()
+        print("  Tables in library.db afterwards (should be 0):", tables)
+        print("  Scratch files left (should be []):", sorted(p.name for p in Path(tmp).glob("*.building*")))
+
+        shutil.copy(DATA_DIR / "borrower.csv", data / "borrower.csv")
+        initDb(db_path, data)
+        conn = sqlite3.connect(db_path)
+        borrowers = conn.execute("SELECT COUNT(*) FROM BORROWER;").fetchone()[0]
+        conn.close()
+        print("  Borrowers after a complete load (should be > 0):", borrowers)
+
+# ===========================
+# migration TESTS
+# ===========================
+
+def test_migrate_existing_database(db: LibraryDB):
+    print("\n[MIGRATION TEST] migrate upgrades a version 0 database in place")
+    cur = db.cur
+
+    # What a library.db from before the migrations looked like
+    cur.execute("DROP INDEX IDX_BOOK_LOANS_CARD_ID;")
+    cur.execute("PRAGMA user_version = 0;")
+    db.conn.commit()
+
+    applied = migrate(db.conn)
+    print(f"  Migrations applied (should be {LATEST_VERSION}):", applied)
+    print(f"  Schema version (should be {LATEST_VERSION}):", schemaVersion(db.conn))
+    cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'IDX_BOOK_LOANS_CARD_ID';")
+    print("  Card_id index restored (should be 1):", cur.fetchone()[0])
+    print("  Second run applies nothing (should be 0):", migrate(db.conn))
+
+
+def test_duplicate_active_loans_stop_init():
+    print("\n[MIGRATION TEST] createIndexes refuses a database with two active loans of one book")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(Path(tmp) / "library.db")
+        createTables(conn, deferIndexes=True)
+        conn.execute("INSERT INTO BOOK (Isbn, Title) VALUES ('DUP0000001', 'Twice Lent');")
+        conn.execute("INSERT INTO BORROWER VALUES ('ID000001', '000-00-0001', 'A', 'B', 'C', 'D');")
+        conn.executemany(
+            "INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in) "
+            "VALUES ('DUP0000001', 'ID000001', '2025-01-01', '2025-01-15', NULL);",
+            [(), ()],
+        )
+        conn.commit()
+        try:
+            createIndexes(conn)
+            print("  createIndexes (should fail listing loans 1 and 2): succeeded")
+        except sqlite3.IntegrityError as exc:
+            print("  createIndexes (should fail listing loans 1 and 2):", "DUP0000001: loans 1, 2" in str(exc))
+        conn.close()
+
 # ===========================
 # MAIN
 # ===========================
@@ -630,6 +1306,10 @@ def main():
     test_search_no_results(db)
     test_search_empty_query(db)
     test_search_case_insensitive(db)
+    test_search_author_substring(db)
+    test_search_status_out(db)
+    test_search_pagination(db)
+    test_search_cache(db)
 
     print("\n=== create_borrower tests ===")
     test_create_borrower_success_and_duplicate(db)
@@ -640,11 +1320,19 @@ def main():
     test_checkout_max_loans(db)
     test_checkout_nonexistent_book(db)
     test_checkout_book_already_out(db)
+    test_checkout_books_cart(db)
+    test_checkout_concurrent_stations(db)
+    test_search_during_write(db)
+    test_read_inside_write(db)
+    test_async_lanes(db)
+    test_borrower_account_summary(db)
 
     print("\n=== checkin_book tests (success cases) ===")
     test_checkin_book_by_card_id(db)
     test_checkin_book_by_isbn(db)
     test_checkin_book_by_borrower_name(db)
+    test_checkin_loans_by_id(db)
+    test_find_loans_for_checkin_authors(db)
 
     print("\n=== checkin_book tests (failure cases) ===")
     test_checkin_book_no_matching_loans(db)
@@ -655,12 +1343,25 @@ def main():
     print("\n=== update_fines tests ===")
     test_update_fines_returned_and_out(db)
     test_update_fines_respects_paid_and_updates_unpaid(db)
+    test_update_fines_incremental(db)
+    test_iter_accrue_fines_resumes(db)
 
     print("\n=== pay_fines tests ===")
     test_pay_fines_behavior(db)
     test_pay_fines_no_fines(db)
 
-    db.conn.close()
+    print("\n=== catalog sync tests ===")
+    test_sync_catalog_delta(db)
+    test_init_db_interrupted_load()
+
+    print("\n=== migration tests ===")
+    test_migrate_existing_database(db)
+    test_duplicate_active_loans_stop_init()
+
+    print("\n=== report tests ===")
+    test_search_fines_and_active_loans(db)
+
+    db.close()
 
 
 if __name__ == "__main__":
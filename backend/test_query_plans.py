@@ -0,0 +1,363 @@
+import contextlib
+import io
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+from init_db import initDb, DB_PATH
+from library_db import LibraryDB
+from statements import STATEMENTS
+
+# Tables that grow with the catalog or the loan history. Reading every row of
+# one of these (or every entry of a full index on it) is a full scan.
+LARGE_TABLES = {"BOOK", "AUTHORS", "BOOK_AUTHORS", "BORROWER", "BOOK_LOANS", "FINES", "BORROWER_ACCOUNT"}
+
+
+def copy_database(tmp):
+    # Plans are checked on a copy so the loans created here never reach
+    # library.db. The backup API also copies commits still in library.db-wal
+    # (e.g. while the GUI is open), which copying the file would miss.
+    if not DB_PATH.exists():
+        initDb()
+    path = Path(tmp) / "library.db"
+    source = sqlite3.connect(DB_PATH)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return LibraryDB(path)
+
+
+def capture_statements(db: LibraryDB, action):
+    """
+    Run action(db) and return the SQL statements it executed, with bound
+    values filled in, minus transaction control and SQLite's own statements
+    (FTS5 shadow tables, trigger bodies).
+    """
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            action(db)
+    finally:
+        db.conn.set_trace_callback(None)
+
+    captured = []
+    for sql in statements:
+        head = sql.lstrip().upper()
+        if head.startswith(("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "--")) or "'main'." in sql:
+            continue
+        if sql not in captured:
+            captured.append(sql)
+    return captured
+
+
+def table_aliases(sql):
+    # alias -> table for every FROM/JOIN/UPDATE/INTO in the statement
+    aliases = {}
+    for table, alias in re.findall(
+            r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+        aliases[table.upper()] = table.upper()
+        if alias and alias.upper() not in ("WHERE", "ON", "SET", "USING", "JOIN", "LEFT",
+                                           "INNER", "CROSS", "GROUP", "ORDER", "LIMIT", "VALUES"):
+            aliases[alias.upper()] = table.upper()
+    return aliases
+
+
+def partial_indexes(db: LibraryDB):
+    db.cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '%WHERE%';")
+    return {row[0].upper() for row in db.cur.fetchall()}
+
+
+def plan_problems(db: LibraryDB, sql):
+    """
+    The steps of sql's query plan that get slower as the library grows:
+      - a SCAN of a large table, or of a full index on one (scans of partial
+        indexes only read the rows they cover)
+      - an automatic index built for the statement
+      - a temp B-tree to sort for GROUP BY or ORDER BY
+    """
+    aliases = table_aliases(sql)
+    partial = partial_indexes(db)
+
+    db.cur.execute("EXPLAIN QUERY PLAN " + sql)
+    problems = []
+    for _id, _parent, _notused, detail in db.cur.fetchall():
+        if "AUTOMATIC" in detail:
+            problems.append(detail)
+            continue
+        if "TEMP B-TREE" in detail and ("GROUP BY" in detail or "ORDER BY" in detail):
+            problems.append(detail)
+            continue
+        match = re.match(r"SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?", detail)
+        if match is None or "VIRTUAL TABLE" in detail:
+            continue
+        name, index = match.groups()
+        if aliases.get(name.upper(), name.upper()) not in LARGE_TABLES:
+            continue
+        if index is not None and index.upper() in partial:
+            continue
+        problems.append(detail)
+    return problems
+
+
+def is_statement(sql, name):
+    # Whether captured sql was built from statements.STATEMENTS[name]: its
+    # text matches up to the first template field or bound value
+    text = re.split(r"[{?:]", STATEMENTS[name], maxsplit=1)[0]
+    return " ".join(sql.split()).startswith(" ".join(text.split()))
+
+
+def allowed_key(allow, sql, detail):
+    # The allow entry covering detail in sql, if any
+    if detail in allow:
+        return detail
+    for key in allow:
+        if isinstance(key, tuple) and key[1] == detail and is_statement(sql, key[0]):
+            return key
+    return None
+
+
+def check_plans(db: LibraryDB, title, action, allow=None):
+    """
+    Run action(db) and check the plan of every statement it executes.
+    allow maps plan steps this call is expected to take to the reason why
+    (e.g. a whole-table report); any other problem step fails the check.
+    A key of (statement name, step) allows the step only in that statement.
+    """
+    allow = allow or {}
+    print(f"\n[PLAN TEST] {title}")
+    statements = capture_statements(db, action)
+    ok = True
+    allowed = set()
+    for sql in statements:
+        for detail in plan_problems(db, sql):
+            key = allowed_key(allow, sql, detail)
+            if key is not None:
+                allowed.add(key)
+                continue
+            ok = False
+            print("  PROBLEM in:", " ".join(sql.split())[:160])
+            print("    ", detail)
+    for key in sorted(allowed, key=str):
+        print(f"  allowed {key!r}: {allow[key]}")
+    print(f"  {len(statements)} statements, plans ok (should be True):", ok)
+    return ok
+
+
+def sample_borrower(db: LibraryDB):
+    db.cur.execute("SELECT Card_id, Bname FROM BORROWER ORDER BY Card_id LIMIT 1;")
+    return db.cur.fetchone()
+
+
+def sample_isbns(db: LibraryDB, count):
+    db.cur.execute("SELECT Isbn FROM BOOK ORDER BY Isbn LIMIT ?;", (count,))
+    return [row[0] for row in db.cur.fetchall()]
+
+
+# ===========================
+# search TESTS
+# ===========================
+
+def test_plan_search_books(db: LibraryDB):
+    isbn = sample_isbns(db, 1)[0]
+    return check_plans(db, "search_books by title, author and ISBN, paged", lambda db: (
+        db.search_books("history", limit=50),
+        db.search_books("smith", include_holder=True, limit=50),
+        db.search_books(isbn, limit=50),
+        db.search_books("history", limit=5, after_key=isbn),
+        db.search_books("", limit=50),
+        db.search_books("", limit=50, after_key=isbn),
+        list(db.iter_search_books("the", page_size=100)),
+        db.clear_search_cache(),
+    ))
+
+
+def test_plan_search_books_short_query(db: LibraryDB):
+    # The trigram index needs three plain characters; a page of a shorter
+    # query tests books in ISBN order, the complete result is a scan by design.
+    reason = "queries the trigram index can't answer scan by design"
+    return check_plans(db, "search_books fallback for short queries", lambda db: (
+        db.search_books("ab", limit=50),
+        db.search_books("ab", limit=50, after_key="1"),
+        db.clear_search_cache(),
+        db.search_books("ab"),
+    ), allow={"SCAN BOOK": reason, "SCAN BA": reason})
+
+
+# ===========================
+# borrower and checkout TESTS
+# ===========================
+
+def test_plan_authenticate_and_create_borrower(db: LibraryDB):
+    card_id, _name = sample_borrower(db)
+    return check_plans(db, "authenticate_borrower and create_borrower", lambda db: (
+        db.authenticate_borrower(card_id, "wrong"),
+        db.create_borrower("999-00-0001", "Plan Test", "1 Test St", "555-0100", "secret"),
+    ))
+
+
+def test_plan_checkout(db: LibraryDB):
+    card_id, _name = sample_borrower(db)
+    isbns = sample_isbns(db, 2)
+    return check_plans(db, "checkout_book and checkout_books", lambda db: (
+        db.checkout_book(isbns[0], card_id),
+        db.checkout_books([(card_id, isbns[1]), (card_id, isbns[0])]),
+    ))
+
+
+# ===========================
+# checkin TESTS
+# ===========================
+
+def test_plan_find_loans_for_checkin(db: LibraryDB):
+    card_id, name = sample_borrower(db)
+    isbn = sample_isbns(db, 1)[0]
+    return check_plans(db, "find_loans_for_checkin by Card_id, ISBN and name", lambda db: (
+        db.find_loans_for_checkin(card_id),
+        db.find_loans_for_checkin(isbn),
+        db.find_loans_for_checkin(name.split()[0]),
+        db.find_loans_for_checkin("ab"),
+        db.find_loans_for_checkin(""),
+    ), allow={
+        ("loans_for_checkin", "USE TEMP B-TREE FOR ORDER BY"):
+            "only the loans matching the query are sorted",
+    })
+
+
+def test_plan_checkin(db: LibraryDB):
+    card_id, _name = sample_borrower(db)
+    loans = db.find_loans_for_checkin(card_id)
+    return check_plans(db, "checkin_loans and checkin_book", lambda db: (
+        db.checkin_loans([loans[0]["loan_id"]]),
+        # the borrower still has the loan from test_plan_checkout
+        db.checkin_book(card_id, [1]),
+    ), allow={
+        ("loans_for_checkin", "USE TEMP B-TREE FOR ORDER BY"):
+            "checkin_book sorts the borrower's few loans",
+    })
+
+
+# ===========================
+# fines TESTS
+# ===========================
+
+def test_plan_fines(db: LibraryDB):
+    card_id, name = sample_borrower(db)
+    db.update_fines()
+    return check_plans(db, "incremental update_fines, pay_fines and search_fines", lambda db: (
+        db.update_fines(incremental=True),
+        db.update_fines(loan_ids=[1, 2, 3]),
+        db.pay_fines(card_id),
+        db.search_fines(name.split()[0]),
+        db.search_fines(card_id, include_paid=True),
+        db.search_fines(""),
+    ))
+
+
+def test_plan_full_fine_runs(db: LibraryDB):
+    # Recalculating every fine reads every loan; the batch run does it one
+    # Loan_id range at a time.
+    return check_plans(db, "full update_fines and iter_accrue_fines", lambda db: (
+        db.update_fines(),
+        list(db.iter_accrue_fines(chunk_size=100, restart=True)),
+    ), allow={"SCAN BOOK_LOANS": "a full fine run recalculates every loan"})
+
+
+def test_plan_whole_table_reports(db: LibraryDB):
+    return check_plans(db, "fine history of every borrower and repair_borrower_accounts", lambda db: (
+        db.search_fines("", include_paid=True),
+        db.repair_borrower_accounts(),
+    ), allow={
+        "SCAN BL USING COVERING INDEX IDX_BOOK_LOANS_CARD_ID": "totals every borrower's loans, grouped off the index",
+        "SCAN B USING COVERING INDEX sqlite_autoindex_BORROWER_1": "recomputes every borrower's account",
+        "SCAN BORROWER_ACCOUNT": "drops accounts of deleted borrowers",
+    })
+
+
+def test_plan_list_active_loans(db: LibraryDB):
+    return check_plans(db, "list_active_loans", lambda db: db.list_active_loans())
+
+
+# ===========================
+# coverage TESTS
+# ===========================
+
+def public_methods():
+    return sorted(
+        name for name, member in vars(LibraryDB).items()
+        if callable(member) and not name.startswith("_")
+    )
+
+
+def record_calls(called):
+    # Note every public LibraryDB method as it is called
+    def recording(name, method):
+        def wrapper(*args, **kwargs):
+            called.add(name)
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in public_methods():
+        setattr(LibraryDB, name, recording(name, getattr(LibraryDB, name)))
+
+
+def test_every_method_checked(called):
+    print("\n[PLAN TEST] every public LibraryDB method is exercised above")
+    missing = [name for name in public_methods() if name not in called]
+    print("  Methods without a plan check (should be []):", missing)
+    return not missing
+
+
+def test_gui_issues_no_sql():
+    # LibraryGUI reaches SQLite only through LibraryDB, so the checks above
+    # cover its statements too
+    print("\n[PLAN TEST] gui.py runs no SQL of its own")
+    source = (Path(__file__).parent / "gui.py").read_text(encoding="utf-8")
+    found = re.findall(r"\.(?:execute|executemany|executescript|cursor)\(|\bsqlite3\b|\.cur\b|\.conn\b", source)
+    print("  SQL calls in gui.py (should be []):", found)
+    return not found
+
+
+# ===========================
+# MAIN
+# ===========================
+
+def main():
+    called = set()
+    record_calls(called)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = copy_database(tmp)
+
+        print("=== query plan tests ===")
+        results = [
+            test_plan_search_books(db),
+            test_plan_search_books_short_query(db),
+            test_plan_authenticate_and_create_borrower(db),
+            test_plan_checkout(db),
+            test_plan_find_loans_for_checkin(db),
+            test_plan_checkin(db),
+            test_plan_fines(db),
+            test_plan_full_fine_runs(db),
+            test_plan_whole_table_reports(db),
+            test_plan_list_active_loans(db),
+        ]
+        db.close()
+
+    results += [
+        test_every_method_checked(called),
+        test_gui_issues_no_sql(),
+    ]
+
+    failed = results.count(False)
+    print(f"\n{len(results) - failed} of {len(results)} plan tests passed.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
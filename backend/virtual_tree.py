@@ -0,0 +1,277 @@
+from tkinter import ttk
+
+# Modifier bits in a Tk event's state
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+
+class VirtualTreeview(ttk.Frame):
+    """
+    A ttk.Treeview that only keeps the visible window of rows as Tk items.
+
+    Rows live in a plain Python list; scrolling re-fills the same handful of
+    items with different values instead of inserting one item per row, so
+    showing tens of thousands of rows costs the same as showing one screen.
+
+    - rows can be any objects; row_values(row) gives the column values
+      (defaults to the row itself, e.g. a tuple).
+    - Selection is tracked by row index, so it survives scrolling. Clicks
+      and arrow keys are handled here rather than by Tk, which only knows
+      the pooled items: a Shift range runs from the anchor row even after
+      it has scrolled out of view.
+    - on_near_end() is called when the view scrolls within a screen of the
+      last loaded row (used to fetch the next page of results).
+    """
+
+    def __init__(self, parent, columns, height=15, selectmode="browse",
+                 row_values=None, on_near_end=None):
+        super().__init__(parent)
+
+        self.rows = []
+        self.row_values = row_values or (lambda row: row)
+        self.on_near_end = on_near_end
+        self.selectmode = selectmode
+
+        # index of the first visible row, and how many rows fit on screen
+        self.offset = 0
+        self.visible_rows = height
+        self.selected = set()
+        # row indices of the Shift range anchor and the keyboard focus
+        self.anchor = None
+        self.focus_index = None
+
+        self.tree = ttk.Treeview(
+            self,
+            columns=columns,
+            show="headings",
+            height=height,
+            selectmode=selectmode,
+        )
+        self.tree.grid(row=0, column=0, sticky="nsew")
+
+        self.scrollbar = ttk.Scrollbar(
+            self,
+            orient="vertical",
+            command=self.on_scrollbar,
+        )
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        # Tk items currently showing rows[offset:offset + len(self.items)]
+        self.items = []
+
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self.on_arrow(e, -1))
+        self.tree.bind("<Down>", lambda e: self.on_arrow(e, 1))
+        self.tree.bind("<Prior>", lambda e: self.scroll_by(-self.visible_rows) or "break")
+        self.tree.bind("<Next>", lambda e: self.scroll_by(self.visible_rows) or "break")
+        self.tree.bind("<Configure>", self.on_resize)
+
+    # -------------------------------------------------
+    # Treeview pass-throughs
+    # -------------------------------------------------
+    def heading(self, column, **kwargs):
+        return self.tree.heading(column, **kwargs)
+
+    def column(self, column, **kwargs):
+        return self.tree.column(column, **kwargs)
+
+    # -------------------------------------------------
+    # Rows
+    # -------------------------------------------------
+    def set_rows(self, rows):
+        """Replace all rows and scroll back to the top."""
+        self.rows = list(rows)
+        self.offset = 0
+        self.selected = set()
+        self.anchor = None
+        self.focus_index = None
+        self.render()
+
+    def append_rows(self, rows):
+        """Add rows at the end, keeping scroll position and selection."""
+        self.rows.extend(rows)
+        self.render()
+
+    def clear(self):
+        self.set_rows([])
+
+    def selected_indices(self):
+        """0-based positions of the selected rows, in display order."""
+        return [i for i in sorted(self.selected) if i < len(self.rows)]
+
+    def selected_rows(self):
+        """The selected row objects, in display order."""
+        return [self.rows[i] for i in self.selected_indices()]
+
+    # -------------------------------------------------
+    # Rendering
+    # -------------------------------------------------
+    def render(self):
+        max_offset = max(0, len(self.rows) - self.visible_rows)
+        self.offset = min(max(0, self.offset), max_offset)
+        window = self.rows[self.offset:self.offset + self.visible_rows]
+        first_render = not self.items and window
+
+        # Grow or shrink the item pool to the window size, then refill it
+        while len(self.items) < len(window):
+            self.items.append(self.tree.insert("", "end"))
+        while len(self.items) > len(window):
+            self.tree.delete(self.items.pop())
+
+        for item_id, row in zip(self.items, window):
+            self.tree.item(item_id, values=self.row_values(row))
+
+        # The resulting <<TreeviewSelect>> leaves self.selected unchanged
+        visible_selected = [
+            item_id
+            for i, item_id in enumerate(self.items)
+            if self.offset + i in self.selected
+        ]
+        self.tree.selection_set(visible_selected)
+        if self.focus_index is not None and 0 <= self.focus_index - self.offset < len(self.items):
+            self.tree.focus(self.items[self.focus_index - self.offset])
+
+        self.update_scrollbar()
+        if first_render:
+            self.after_idle(self.fit_to_height)
+
+        if self.on_near_end and self.offset + 2 * self.visible_rows >= len(self.rows):
+            self.on_near_end()
+
+    def update_scrollbar(self):
+        if not self.rows:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        total = len(self.rows)
+        first = self.offset / total
+        last = min(1.0, (self.offset + self.visible_rows) / total)
+        self.scrollbar.set(first, last)
+
+    # -------------------------------------------------
+    # Scrolling
+    # -------------------------------------------------
+    def scroll_by(self, delta):
+        self.offset += delta
+        self.render()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * len(self.rows))
+            self.render()
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_by(int(value) * step)
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        if abs(event.delta) >= 120:
+            self.scroll_by(-(event.delta // 120) * 3)
+        else:
+            self.scroll_by(-event.delta)
+        return "break"
+
+    def on_arrow(self, event, direction):
+        # Move the focus a row, scrolling past the first/last visible item;
+        # with Shift held the selection runs from the anchor to it
+        if not self.rows:
+            return "break"
+        if self.focus_index is None:
+            index = self.offset
+        else:
+            index = min(max(0, self.focus_index + direction), len(self.rows) - 1)
+        self.select_row(index, extend=bool(event.state & SHIFT_MASK))
+        return "break"
+
+    def scroll_to(self, index):
+        # Bring rows[index] into the visible window
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.visible_rows:
+            self.offset = index - self.visible_rows + 1
+
+    def on_resize(self, _event):
+        self.fit_to_height()
+
+    def fit_to_height(self):
+        # Match the number of items to the widget height once row size is known
+        if not self.items:
+            return
+        bbox = self.tree.bbox(self.items[0])
+        if not bbox:
+            return
+        _x, top, _width, row_height = bbox
+        rows = max(1, (self.tree.winfo_height() - top) // max(1, row_height))
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+
+    # -------------------------------------------------
+    # Selection
+    # -------------------------------------------------
+    def on_click(self, event):
+        # Clicks on rows select by row index; headings etc. are left to Tk
+        item_id = self.tree.identify_row(event.y)
+        if item_id not in self.items:
+            return None
+        self.tree.focus_set()
+        self.select_row(
+            self.offset + self.items.index(item_id),
+            extend=bool(event.state & SHIFT_MASK),
+            toggle=bool(event.state & CONTROL_MASK),
+        )
+        return "break"
+
+    def select_row(self, index, extend=False, toggle=False):
+        """
+        Select rows[index] the way Tk would for a click: plain replaces the
+        selection, toggle (Control) flips one row, extend (Shift) selects
+        the range from the anchor row. The row gets the focus and is
+        scrolled into view.
+        """
+        if self.selectmode == "none":
+            return
+        if self.selectmode == "browse":
+            extend = toggle = False
+
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected = set(range(low, high + 1))
+        elif toggle:
+            self.selected ^= {index}
+            self.anchor = index
+        else:
+            self.selected = {index}
+            self.anchor = index
+
+        self.focus_index = index
+        self.scroll_to(index)
+        self.render()
+
+    def on_tree_select(self, _event):
+        selected_items = set(self.tree.selection())
+        visible = {
+            self.offset + i: item_id
+            for i, item_id in enumerate(self.items)
+        }
+        newly_selected = {
+            index
+            for index, item_id in visible.items()
+            if item_id in selected_items and index not in self.selected
+        }
+
+        if self.selectmode == "browse" and newly_selected:
+            self.selected = newly_selected
+            return
+
+        for index, item_id in visible.items():
+            if item_id in selected_items:
+                self.selected.add(index)
+            else:
+                self.selected.discard(index)